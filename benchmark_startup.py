@@ -0,0 +1,126 @@
+"""
+Measure the bot's time-to-first-poll.
+
+Starts `python bot.py` against a stub Bot API server on localhost (through
+TELEGRAM_API_URL) and reports how long it takes from process start until
+the first getUpdates request arrives. Runs in a scratch directory so the
+bot's state and media files don't touch the real ones.
+
+    python benchmark_startup.py [--runs 5] [--importtime]
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import statistics
+import subprocess
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+TIMEOUT = 120
+
+first_poll = threading.Event()
+
+
+class StubApi(BaseHTTPRequestHandler):
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        self.rfile.read(length)
+        method = self.path.rsplit("/", 1)[-1].split("?")[0]
+        if method == "getUpdates":
+            first_poll.set()
+            result = []
+        elif method == "getMe":
+            result = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "bench",
+                "username": "bench",
+            }
+        else:
+            result = True
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(api_url, importtime=False):
+    first_poll.clear()
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:benchmark")
+    env.update(TELEGRAM_API_URL=api_url, BOT_MODE="polling", PYTHONUNBUFFERED="1")
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd.append(BOT_SCRIPT)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stderr = subprocess.PIPE if importtime else subprocess.DEVNULL
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        polled = first_poll.wait(TIMEOUT)
+        elapsed = time.perf_counter() - start
+        process.terminate()
+        _, err = process.communicate(timeout=30)
+
+    if not polled:
+        raise RuntimeError(f"bot.py did not poll within {TIMEOUT}s")
+    return elapsed, err.decode(errors="replace") if err else ""
+
+
+def slowest_imports(report, count=15):
+    rows = []
+    for line in report.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--importtime", action="store_true", help="also list the slowest imports"
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    timings = []
+    for run in range(args.runs):
+        elapsed, report = measure(api_url, args.importtime and run == 0)
+        timings.append(elapsed)
+        print(f"run {run + 1}: {elapsed * 1000:.0f} ms to first poll")
+        if report:
+            print("slowest imports (cumulative us):")
+            for micros, name in slowest_imports(report):
+                print(f"  {micros:>9}  {name}")
+    server.shutdown()
+
+    print(
+        f"time-to-first-poll: median {statistics.median(timings) * 1000:.0f} ms, "
+        f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
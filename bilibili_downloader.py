@@ -2,13 +2,14 @@ import os
 import sys
 import time
 import random
-import requests
 import subprocess
 from bilibili_api import video, Credential
 from yt_dlp import YoutubeDL
 from dotenv import load_dotenv
 
 import utils
+import transcode
+import http_client
 
 load_dotenv()
 
@@ -26,7 +27,7 @@ credential = Credential(
 async def get_video_info(video_url):
     try:
         if "b23.tv" in video_url:
-            response = requests.head(video_url, allow_redirects=True)
+            response = http_client.head(video_url, allow_redirects=True)
             video_url = response.url
             print(f"Expanded URL to: {video_url}")
         bv_id = None
@@ -69,7 +70,23 @@ async def get_video_info(video_url):
         return None
 
 
-async def download_bilibili_video(video_url):
+def _progress_bar(label, progress_callback=None):
+    def report(downloaded, total_size):
+        if total_size:
+            progress = int(50 * downloaded / total_size)
+            sys.stdout.write(
+                f"\r{label}: [{'#'*progress}{' '*(50-progress)}] {downloaded/total_size*100:.1f}%"
+            )
+            sys.stdout.flush()
+            if progress_callback:
+                progress_callback(
+                    f"downloading {label.lower()} {downloaded/total_size*100:.0f}%"
+                )
+
+    return report
+
+
+async def download_bilibili_video(video_url, progress=None):
     try:
         print(f"Getting information for video: {video_url}")
         info = await get_video_info(video_url)
@@ -84,8 +101,7 @@ async def download_bilibili_video(video_url):
         account_dir = os.path.join(BILIBILI_MEDIA_DIR, author_sanitized)
         video_dir = os.path.join(account_dir, bv_id)
 
-        if not os.path.exists(account_dir):
-            os.makedirs(account_dir)
+        utils.make_account_dir("bilibili", author_sanitized, account_dir)
         if not os.path.exists(video_dir):
             os.makedirs(video_dir)
 
@@ -140,36 +156,24 @@ async def download_bilibili_video(video_url):
             temp_audio_path = os.path.join(video_dir, f"temp_audio_{bv_id}.m4s")
 
             print("Downloading video stream...")
-            with requests.get(video_url_sel, headers=headers, stream=True) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get("content-length", 0))
-                downloaded = 0
-                with open(temp_video_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = int(50 * downloaded / total_size)
-                            sys.stdout.write(
-                                f"\rVideo: [{'#'*progress}{' '*(50-progress)}] {downloaded/total_size*100:.1f}%"
-                            )
-                            sys.stdout.flush()
+            if not utils.download_media(
+                video_url_sel,
+                temp_video_path,
+                timeout=30,
+                headers=headers,
+                progress=_progress_bar("Video", progress),
+            ):
+                raise Exception("Video stream download failed")
             print("\nVideo download complete!")
             print("Downloading audio stream...")
-            with requests.get(audio_url, headers=headers, stream=True) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get("content-length", 0))
-                downloaded = 0
-                with open(temp_audio_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = int(50 * downloaded / total_size)
-                            sys.stdout.write(
-                                f"\rAudio: [{'#'*progress}{' '*(50-progress)}] {downloaded/total_size*100:.1f}%"
-                            )
-                            sys.stdout.flush()
+            if not utils.download_media(
+                audio_url,
+                temp_audio_path,
+                timeout=30,
+                headers=headers,
+                progress=_progress_bar("Audio", progress),
+            ):
+                raise Exception("Audio stream download failed")
             print("\nAudio download complete!")
             try:
                 print("Merging video and audio with FFmpeg...")
@@ -203,6 +207,9 @@ async def download_bilibili_video(video_url):
                 os.remove(temp_video_path)
             if os.path.exists(temp_audio_path):
                 os.remove(temp_audio_path)
+            if progress:
+                progress("preparing video for upload", force=True)
+            video_path = transcode.fit_for_upload(video_path)
 
         utils.register_account("bilibili", author_sanitized)
         utils.save_media_mapping(f"bilibili_{author_sanitized}", bv_id, [video_path])
@@ -212,31 +219,31 @@ async def download_bilibili_video(video_url):
         return None
 
 
-async def process_video(video_url):
+async def process_video(video_url, progress=None):
     print(f"Processing video: {video_url}")
-    sent_videos = utils.load_sent_videos()
     video_id = None
     if "BV" in video_url:
         video_id = "BV" + video_url.split("BV")[1].split("?")[0].split("/")[0]
     elif "av" in video_url.lower():
         video_id = "av" + video_url.lower().split("av")[1].split("?")[0].split("/")[0]
-    if video_id and video_id in sent_videos["videos"]:
+    if video_id and utils.is_video_sent(video_id):
         print(f"Video {video_id} already sent previously.")
         return False
-    result = await download_bilibili_video(video_url)
+    result = await download_bilibili_video(video_url, progress)
     if not result:
         print("Failed to download video")
         return False
     info = result["info"]
     caption = f"{info['title']}\n\n{info['url']}"
 
+    if progress:
+        progress("uploading to Telegram", force=True)
     success = utils.send_to_telegram(
         caption, media_paths=[result["path"]], media_types=["video"]
     )
 
     if success and video_id:
-        sent_videos["videos"].append(video_id)
-        utils.save_sent_videos(sent_videos)
+        utils.mark_video_sent(video_id)
         print(f"Successfully sent video {video_id} to Telegram")
         return True
     return False
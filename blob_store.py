@@ -0,0 +1,105 @@
+import os
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed store for media files, keyed by SHA-256.
+
+    Each distinct file body is kept once as <root>/<aa>/<sha256><ext>. The
+    per-account/per-post paths the bot works with are hardlinks to it, so
+    saving the same image twice costs one directory entry instead of a copy.
+    A blob's link count tells how many media paths still use it; blobs left
+    with a single link are orphans that prune() removes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def blob_path(self, digest, ext=""):
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+
+    def ingest(self, path):
+        """
+        Move a freshly saved file into the store, leaving a hardlink at path.
+        Returns the file's SHA-256, or None if it could not be linked.
+        """
+        try:
+            digest = file_sha256(path)
+            blob = self.blob_path(digest, os.path.splitext(path)[1])
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                    return digest
+                except FileExistsError:
+                    pass  # stored by someone else in the meantime
+
+            if os.path.samefile(path, blob):
+                return digest
+            # Same content already stored: swap the copy for a link to it
+            tmp_path = path + ".link"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, path)
+            return digest
+        except OSError as e:
+            print(f"Could not add {path} to the blob store: {e}")
+            return None
+
+    def _blobs(self):
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.scandir(self.root):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if entry.is_file():
+                        yield entry
+
+    def _stat(self, entry):
+        # DirEntry.stat() reports st_nlink as 0 on Windows, so ask the file
+        return os.stat(entry.path)
+
+    def report(self):
+        """Blob count, bytes on disk, references and bytes saved by dedup"""
+        stats = {"blobs": 0, "stored_bytes": 0, "references": 0, "saved_bytes": 0}
+        for entry in self._blobs():
+            st = self._stat(entry)
+            refs = max(st.st_nlink - 1, 0)
+            stats["blobs"] += 1
+            stats["stored_bytes"] += st.st_size
+            stats["references"] += refs
+            if refs > 1:
+                stats["saved_bytes"] += st.st_size * (refs - 1)
+        return stats
+
+    def prune(self):
+        """Delete blobs no media path links to any more, returns (count, bytes)"""
+        removed = 0
+        freed = 0
+        for entry in self._blobs():
+            st = self._stat(entry)
+            if st.st_nlink == 0:
+                # Link counts unknown on this filesystem: a blob can't be
+                # told from an orphan, so keep everything
+                print("Blob store link counts are unavailable, skipping prune")
+                break
+            if st.st_nlink == 1:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return removed, freed
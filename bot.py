@@ -1,7 +1,8 @@
 import os
+import sys
+import signal
 import asyncio
 import telebot
-import telebot.apihelper
 from telebot import types
 import json
 from collections import defaultdict
@@ -12,148 +13,193 @@ from datetime import datetime
 import re
 from urllib.parse import urlparse
 
-telebot.apihelper.CONNECT_TIMEOUT = 60
-telebot.apihelper.READ_TIMEOUT = 600
-
 import utils
-import fetchers
-import bilibili_downloader
-import youtube_downloader
+import lazy_import
 import sakurazaka_news
 import hinatazaka_news
-import nogi_news
-import media_from_link
+
+# Imported on first use: these pull in instaloader, bilibili_api, yt_dlp
+# and selenium, which most sessions never need
+fetchers = lazy_import.lazy("fetchers")
+bilibili_downloader = lazy_import.lazy("bilibili_downloader")
+youtube_downloader = lazy_import.lazy("youtube_downloader")
+nogi_news = lazy_import.lazy("nogi_news")
+media_from_link = lazy_import.lazy("media_from_link")
+import webhook_server
+import jobs
+import session_store
+import scheduler
+import twitter_budget
 
 BOT_TOKEN = utils.BOT_TOKEN
-if not BOT_TOKEN or BOT_TOKEN.strip() == "":
-    raise ValueError("BOT_TOKEN is not set or is invalid. Please check your .env file.")
 
 CHAT_ID = utils.CHAT_ID
 X_USERNAME = "nagi_italy"
 INSTAGRAM_USERNAME = "nagi.i_official"
 
-bot = telebot.TeleBot(BOT_TOKEN)
+bot = utils.bot
 
-user_states = {}
+# Per-user menu state. Entries only hold small keys; the news and post lists
+# they page through live once in menu_cache, shared by everyone viewing them
+user_states = session_store.SessionStore(path=session_store.SESSION_STORE_FILE or None)
+menu_cache = session_store.SessionStore(
+    max_entries=64, ttl=600, max_bytes=32 * 1024 * 1024
+)
 
 MEDIA_DIR = utils.MEDIA_DIR
-TWITTER_MEDIA_DIR = os.path.join(MEDIA_DIR, "twitter")
-INSTAGRAM_POSTS_DIR = os.path.join(MEDIA_DIR, "instagram", "posts")
-INSTAGRAM_STORIES_DIR = os.path.join(MEDIA_DIR, "instagram", "stories")
-BILIBILI_MEDIA_DIR = os.path.join(MEDIA_DIR, "bilibili")
-
-# Auto-fetch configuration
-auto_fetch_thread = None
-auto_fetch_running = False
+TWITTER_MEDIA_DIR = utils.TWITTER_MEDIA_DIR
+INSTAGRAM_POSTS_DIR = utils.INSTAGRAM_POSTS_DIR
+INSTAGRAM_STORIES_DIR = utils.INSTAGRAM_STORIES_DIR
+BILIBILI_MEDIA_DIR = utils.BILIBILI_MEDIA_DIR
+
+# Auto-fetch configuration; the interval is each account's starting point,
+# the scheduler adapts it per account from there
 auto_fetch_interval = 15 * 60  # 30 minutes in seconds
 auto_fetch_accounts = {"x": [X_USERNAME], "instagram": [INSTAGRAM_USERNAME]}
 last_fetch_time = None
+# Polls each account on its own schedule, created at startup
+auto_fetch_scheduler = None
+# meta key the accounts, interval and on/off state are saved under
+AUTO_FETCH_CONFIG_KEY = "auto_fetch_config"
 
+# Background jobs for long-running commands, created at startup
+job_manager = None
 
-def auto_fetch_worker():
-    """Background worker that periodically checks for new posts"""
-    global auto_fetch_running, last_fetch_time
+# "polling" (default) or "webhook", see webhook_server for its settings
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
 
-    while auto_fetch_running:
-        try:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{current_time}] Running auto fetch...")
 
-            # Fetch X posts
-            for username in auto_fetch_accounts["x"]:
-                try:
-                    new_posts = fetchers.fetch_x_posts(username)
-                    if new_posts:
-                        for post in new_posts:
-                            utils.send_to_telegram(
-                                f"New X post from @{username}:\n\n{post['content']}\n\n{post['url']}",
-                                media_paths=post.get("media_paths"),
-                                media_types=post.get("media_types"),
-                            )
-                        print(
-                            f"[{current_time}] Fetched {len(new_posts)} new X posts from @{username}"
-                        )
-                except Exception as e:
-                    print(f"Error fetching X posts for {username}: {e}")
-                    traceback.print_exc()
+def fetch_account(platform, username):
+    """
+    Fetch and queue one account's new posts; returns how many were found.
+    Where to resume is up to the fetchers: X keeps a since_id high-water
+    mark, Instagram skips the IDs it has seen. Fetch errors are raised, so
+    the scheduler backs off and counts them.
+    """
+    global last_fetch_time
 
-            for username in auto_fetch_accounts["instagram"]:
-                try:
-                    # fetch post
-                    insta_posts = fetchers.fetch_instagram_posts(username)
-                    if insta_posts:
-                        for post in insta_posts:
-                            if post.get("media_paths"):
-                                utils.send_to_telegram(
-                                    f"New Instagram post from @{username}:\n\n{post['content']}\n\n{post['url']}",
-                                    media_paths=post.get("media_paths"),
-                                    media_types=post.get("media_types"),
-                                )
-                            else:
-                                utils.send_to_telegram(
-                                    f"New Instagram post from @{username}:\n\n{post['content']}\n\n{post['url']}",
-                                    media_url=post.get("media_url"),
-                                )
-                        print(
-                            f"[{current_time}] Fetched {len(insta_posts)} new Instagram posts from @{username}"
-                        )
-
-                    # Fetch stories
-                    insta_stories = fetchers.fetch_instagram_stories(username)
-                    if insta_stories:
-                        for story in insta_stories:
-                            if story.get("media_paths"):
-                                utils.send_to_telegram(
-                                    f"New Instagram story from @{username}:\n\n{story['content']}",
-                                    media_paths=story.get("media_paths"),
-                                    media_types=story.get("media_types"),
-                                )
-                            else:
-                                utils.send_to_telegram(
-                                    f" New Instagram story from @{username}:\n\n{story['content']}",
-                                    media_url=story.get("url"),
-                                )
-                        print(
-                            f"[{current_time}] Fetched {len(insta_stories)} new Instagram stories from @{username}"
-                        )
-                except Exception as e:
-                    print(f"Error fetching Instagram content for {username}: {e}")
-                    traceback.print_exc()
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    found = 0
 
-            last_fetch_time = current_time
-        except Exception as e:
-            print(f"Error in auto fetch worker: {e}")
-            traceback.print_exc()
+    if platform == "x":
+        new_posts = fetchers.fetch_x_posts(
+            username, priority=twitter_budget.BACKGROUND, raise_errors=True
+        )
+        if new_posts:
+            for post in new_posts:
+                utils.queue_to_telegram(
+                    f"New X post from @{username}:\n\n{post['content']}\n\n{post['url']}",
+                    media_paths=post.get("media_paths"),
+                    media_types=post.get("media_types"),
+                )
+            print(
+                f"[{current_time}] Fetched {len(new_posts)} new X posts from @{username}"
+            )
+            found += len(new_posts)
 
-        for _ in range(auto_fetch_interval):
-            if not auto_fetch_running:
-                break
-            time.sleep(1)
+    elif platform == "instagram":
+        # fetch post
+        insta_posts = fetchers.fetch_instagram_posts(username, raise_errors=True)
+        if insta_posts:
+            for post in insta_posts:
+                if post.get("media_paths"):
+                    utils.queue_to_telegram(
+                        f"New Instagram post from @{username}:\n\n{post['content']}\n\n{post['url']}",
+                        media_paths=post.get("media_paths"),
+                        media_types=post.get("media_types"),
+                    )
+                else:
+                    utils.queue_to_telegram(
+                        f"New Instagram post from @{username}:\n\n{post['content']}\n\n{post['url']}",
+                        media_url=post.get("media_url"),
+                    )
+            print(
+                f"[{current_time}] Fetched {len(insta_posts)} new Instagram posts from @{username}"
+            )
+            found += len(insta_posts)
 
+    elif platform == "instagram_stories":
+        insta_stories = fetchers.fetch_instagram_stories(username, raise_errors=True)
+        if insta_stories:
+            for story in insta_stories:
+                if story.get("media_paths"):
+                    utils.queue_to_telegram(
+                        f"New Instagram story from @{username}:\n\n{story['content']}",
+                        media_paths=story.get("media_paths"),
+                        media_types=story.get("media_types"),
+                    )
+                else:
+                    utils.queue_to_telegram(
+                        f" New Instagram story from @{username}:\n\n{story['content']}",
+                        media_url=story.get("url"),
+                    )
+            print(
+                f"[{current_time}] Fetched {len(insta_stories)} new Instagram stories from @{username}"
+            )
+            found += len(insta_stories)
+
+    last_fetch_time = current_time
+    return found
 
-def start_auto_fetch():
-    """Start the auto fetch background thread"""
-    global auto_fetch_thread, auto_fetch_running
 
-    if auto_fetch_running:
+def load_auto_fetch_config():
+    """Restore the saved accounts and interval; returns whether auto fetch was on"""
+    global auto_fetch_interval, auto_fetch_accounts
+
+    saved = utils.get_store().get_meta(AUTO_FETCH_CONFIG_KEY)
+    if not saved:
         return False
+    config = json.loads(saved)
+    auto_fetch_interval = config.get("interval", auto_fetch_interval)
+    auto_fetch_accounts.update(config.get("accounts", {}))
+    return config.get("enabled", False)
+
 
-    auto_fetch_running = True
-    auto_fetch_thread = threading.Thread(target=auto_fetch_worker)
-    auto_fetch_thread.daemon = True
-    auto_fetch_thread.start()
-    return True
+def save_auto_fetch_config():
+    config = {
+        "interval": auto_fetch_interval,
+        "accounts": auto_fetch_accounts,
+        "enabled": auto_fetch_scheduler.running,
+    }
+    utils.get_store().set_meta(AUTO_FETCH_CONFIG_KEY, json.dumps(config))
 
 
-def stop_auto_fetch():
-    """Stop the auto fetch background thread"""
-    global auto_fetch_running
+def run_startup_scans():
+    """Discover accounts and re-sync the media index once per start"""
+    try:
+        utils.scan_and_register_accounts()
+        # pick up media added or removed while the bot was offline
+        utils.rescan_media_index()
+        removed, freed = utils.get_blob_store().prune()
+        if removed:
+            print(f"Pruned {removed} unused media blobs ({freed / 1048576:.1f} MB)")
+    except Exception as e:
+        print(f"Error during startup scan: {e}")
+        traceback.print_exc()
 
-    if not auto_fetch_running:
-        return False
 
-    auto_fetch_running = False
-    return True
+def scheduled_accounts():
+    """Accounts to poll per scheduler platform; stories are polled separately"""
+    return {
+        "x": auto_fetch_accounts["x"],
+        "instagram": auto_fetch_accounts["instagram"],
+        "instagram_stories": auto_fetch_accounts["instagram"],
+    }
+
+
+def start_auto_fetch():
+    """Start polling the configured accounts"""
+    auto_fetch_scheduler.sync(scheduled_accounts())
+    started = auto_fetch_scheduler.start()
+    save_auto_fetch_config()
+    return started
+
+
+def stop_auto_fetch():
+    """Stop polling"""
+    stopped = auto_fetch_scheduler.stop()
+    save_auto_fetch_config()
+    return stopped
 
 
 @bot.message_handler(commands=["auto_start"])
@@ -188,21 +234,54 @@ def handle_auto_stop(message):
 @bot.message_handler(commands=["auto_status"])
 def handle_auto_status(message):
     """Check the status of auto fetch"""
-    status = "running" if auto_fetch_running else "stopped"
+    status = "running" if auto_fetch_scheduler.running else "stopped"
     accounts_info = (
         f"X accounts: {', '.join('@' + a for a in auto_fetch_accounts['x'])}\n"
         f"Instagram accounts: {', '.join('@' + a for a in auto_fetch_accounts['instagram'])}"
     )
-    interval_info = f"Checking interval: {auto_fetch_interval//60} minutes"
+    interval_info = f"Base interval: {auto_fetch_interval//60} minutes"
     last_run = (
         f"Last fetch: {last_fetch_time}"
         if last_fetch_time
         else "No fetches performed yet"
     )
 
+    lines = []
+    now = time.time()
+    for schedule in auto_fetch_scheduler.status():
+        if schedule.next_run == float("inf"):
+            next_run = "running now"
+        elif not auto_fetch_scheduler.running:
+            next_run = "paused"
+        else:
+            next_run = f"next in {max(0, schedule.next_run - now) / 60:.0f} min"
+        latency = schedule.average_latency()
+        latency_info = (
+            f", {schedule.latencies[-1]:.1f}s last / {latency:.1f}s avg"
+            if latency is not None
+            else ""
+        )
+        line = (
+            f"{schedule.platform} @{schedule.username}: {next_run}, "
+            f"every {schedule.interval / 60:.0f} min{latency_info}"
+        )
+        if schedule.failures:
+            line += f", {schedule.failures} errors ({schedule.last_error})"
+        lines.append(line)
+    schedule_info = "\n".join(lines)
+
     status_message = (
         f"Auto fetch is {status}\n\n{accounts_info}\n{interval_info}\n{last_run}"
     )
+    if schedule_info:
+        status_message += f"\n\n{schedule_info}"
+    budgets = twitter_budget.budget.status()
+    if budgets:
+        status_message += "\n\nTwitter API budget:\n" + "\n".join(
+            f"{endpoint}: {remaining}/{limit or '?'} left, resets "
+            f"{time.strftime('%H:%M', time.localtime(reset))}"
+            for endpoint, (remaining, limit, reset) in budgets.items()
+        )
     bot.reply_to(message, status_message)
 
 
@@ -242,6 +321,7 @@ def handle_auto_config(message):
                         bot.reply_to(message, "Interval must be at least 5 minutes.")
                         continue
                     auto_fetch_interval = minutes * 60
+                    auto_fetch_scheduler.set_base_interval(auto_fetch_interval)
                 except ValueError:
                     bot.reply_to(message, f"Invalid interval value: {value}")
             elif key == "x" or key == "twitter":
@@ -251,6 +331,9 @@ def handle_auto_config(message):
                 usernames = [u.strip() for u in value.split(",") if u.strip()]
                 auto_fetch_accounts["instagram"] = usernames
 
+        if auto_fetch_scheduler.running:
+            auto_fetch_scheduler.sync(scheduled_accounts())
+        save_auto_fetch_config()
         bot.reply_to(
             message,
             f"Auto fetch configuration updated:\n\n"
@@ -304,84 +387,135 @@ def handle_username_input(message):
     if username.startswith("@"):
         username = username[1:]
 
-    bot.reply_to(message, f"Fetching {platform.upper()} posts for @{username}...")
-
-    if platform == "x":
-        fetch_x_content(message, username)
-    elif platform == "instagram":
-        fetch_instagram_content(message, username)
-
     user_states.pop(user_id, None)
+    job_manager.submit(
+        "fetch",
+        message.chat.id,
+        f"{platform.upper()} posts for @{username}",
+        platform=platform,
+        username=username,
+    )
 
 
-def fetch_x_content(message, username):
-    try:
+def run_fetch_job(job, platform, username):
+    """Fetch new posts of one account and queue them for sending"""
+    if platform in ["x", "twitter"]:
+        job.progress(f"fetching X posts of @{username}", force=True)
         new_posts = fetchers.fetch_x_posts(username)
-        count = len(new_posts)
-
-        if count == 0:
-            bot.send_message(
-                message.chat.id, f"No new posts found for {username} on X."
-            )
-            return
-
+        if not new_posts:
+            return f"No new posts found for {username} on X."
         for post in new_posts:
-            utils.send_to_telegram(
+            utils.queue_to_telegram(
                 f"{post['content']}\n\n{post['url']}",
                 media_paths=post.get("media_paths"),
                 media_types=post.get("media_types"),
             )
-        bot.send_message(
-            message.chat.id, f"Fetched {count} posts from X user @{username}."
-        )
-    except Exception as e:
-        bot.send_message(message.chat.id, f"Error fetching X posts: {e}")
-
+        return f"Fetched {len(new_posts)} posts from X user @{username}."
 
-def fetch_instagram_content(message, username):
-    try:
+    if platform == "instagram":
+        job.progress(f"fetching Instagram posts of {username}", force=True)
         insta_posts = fetchers.fetch_instagram_posts(username)
+        job.progress(f"fetching Instagram stories of {username}", force=True)
         insta_stories = fetchers.fetch_instagram_stories(username)
-        count = len(insta_posts) + len(insta_stories)
-
-        if count == 0:
-            bot.send_message(
-                message.chat.id, f"No new posts found for {username} on Instagram."
-            )
-            return
+        if not insta_posts and not insta_stories:
+            return f"No new posts found for {username} on Instagram."
 
         for post in insta_posts:
             if post.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_paths=post.get("media_paths"),
                     media_types=post.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_url=post.get("media_url"),
                 )
 
         for story in insta_stories:
             if story.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}",
                     media_paths=story.get("media_paths"),
                     media_types=story.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}",
                     media_url=story.get("url"),
                 )
-
-        bot.send_message(
-            message.chat.id,
-            f"Fetched {len(insta_posts)} posts and {len(insta_stories)} stories from Instagram user {username}.",
+        return (
+            f"Fetched {len(insta_posts)} posts and {len(insta_stories)} stories "
+            f"from Instagram user {username}."
         )
-    except Exception as e:
-        bot.send_message(message.chat.id, f"Error fetching Instagram content: {e}")
+
+    return f"Unknown platform '{platform}'. Use 'x' or 'instagram'."
+
+
+def run_backfill_job(job, username, count):
+    """Page back through an X account's timeline and record the posts not seen yet"""
+    job.progress(f"backfilling up to {count} X posts of @{username}", force=True)
+    posts = fetchers.fetch_x_posts(username, backfill=count)
+    if not posts:
+        return f"No older posts of @{username} were missing."
+    return (
+        f"Backfilled {len(posts)} posts of @{username}. "
+        "They were saved without being sent; browse them with /history."
+    )
+
+
+def run_bili_job(job, link):
+    job.progress("downloading Bilibili video", force=True)
+    if not asyncio.run(bilibili_downloader.process_video(link, job.progress)):
+        raise Exception("video was already sent or could not be downloaded")
+    return "Bilibili video sent."
+
+
+def run_youtube_job(job, link):
+    job.progress("downloading YouTube video", force=True)
+    result = asyncio.run(youtube_downloader.process_video(link, job.progress))
+    if not result:
+        raise Exception("Failed to download YouTube video.")
+    job.progress("uploading to Telegram", force=True)
+    caption = f"{result['title']}\n\n{link}"
+    if not utils.send_to_telegram(
+        caption,
+        media_paths=[result["path"]],
+        media_types=["video"],
+    ):
+        raise Exception("Failed to send YouTube video.")
+    return "YouTube video downloaded."
+
+
+def run_url_job(job, message):
+    """Handle the links of a pasted message; message is the update's JSON"""
+    message = types.Message.de_json(message)
+    for url in extract_urls(message.text):
+        job.progress(f"processing {url}", force=True)
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc.lower()
+
+        # Instagram
+        if "instagram.com" in domain:
+            process_instagram_url(message, url, parsed_url)
+
+        # Twitter/X
+        elif "twitter.com" in domain or "x.com" in domain:
+            process_x_url(message, url, parsed_url)
+
+        # Threads
+        elif "threads.net" in domain:
+            process_threads_url(message, url, parsed_url)
+
+
+JOB_HANDLERS = {
+    "fetch": run_fetch_job,
+    "backfill": run_backfill_job,
+    "bili": run_bili_job,
+    "youtube": run_youtube_job,
+    "url": run_url_job,
+}
 
 
 @bot.message_handler(commands=["bili"])
@@ -392,8 +526,7 @@ def handle_bili(message):
             bot.reply_to(message, "Usage: /bili <video_link>")
             return
         link = parts[1].strip()
-        bot.reply_to(message, "Processing Bilibili video...")
-        result = asyncio.run(bilibili_downloader.process_video(link))
+        job_manager.submit("bili", message.chat.id, f"Bilibili {link}", link=link)
     except Exception as e:
         bot.send_message(CHAT_ID, f"Error in /bili command: {e}")
 
@@ -406,18 +539,7 @@ def handle_youtube(message):
             bot.reply_to(message, "Usage: /youtube <video_link>")
             return
         link = parts[1].strip()
-        bot.reply_to(message, "Processing YouTube video...")
-        result = asyncio.run(youtube_downloader.process_video(link))
-        if not result:
-            bot.send_message(CHAT_ID, "Failed to download YouTube video.")
-            return
-        caption = f"{result['title']}\n\n{link}"
-        utils.send_to_telegram(
-            caption,
-            media_paths=[result["path"]],
-            media_types=["video"],
-        )
-        bot.send_message(CHAT_ID, "YouTube video downloaded.")
+        job_manager.submit("youtube", message.chat.id, f"YouTube {link}", link=link)
     except Exception as e:
         bot.send_message(CHAT_ID, f"Error in /youtube command: {e}")
 
@@ -436,70 +558,48 @@ def handle_fetch(message):
         if username.startswith("@"):
             username = username[1:]
 
-        bot.reply_to(message, f"Fetching {platform} posts for {username}...")
+        if platform not in ["x", "twitter", "instagram"]:
+            bot.reply_to(
+                message, f"Unknown platform '{platform}'. Use 'x' or 'instagram'."
+            )
+            return
 
-        if platform in ["x", "twitter"]:
-            new_posts = fetchers.fetch_x_posts(username)
-            count = len(new_posts)
-            if count == 0:
-                bot.send_message(CHAT_ID, f"No new posts found for {username} on X.")
-                return
+        job_manager.submit(
+            "fetch",
+            message.chat.id,
+            f"{platform} posts for {username}",
+            platform=platform,
+            username=username,
+        )
+    except Exception as e:
+        bot.send_message(CHAT_ID, f"Error in /fetch command: {e}")
 
-            for post in new_posts:
-                utils.send_to_telegram(
-                    f"{post['content']}\n\n{post['url']}",
-                    media_paths=post.get("media_paths"),
-                    media_types=post.get("media_types"),
-                )
-            bot.send_message(CHAT_ID, f"Fetched {count} posts from X user @{username}.")
 
-        elif platform == "instagram":
-            insta_posts = fetchers.fetch_instagram_posts(username)
-            insta_stories = fetchers.fetch_instagram_stories(username)
-            count = len(insta_posts) + len(insta_stories)
+@bot.message_handler(commands=["backfill_x"])
+def handle_backfill_x(message):
+    try:
+        parts = message.text.split()
+        if len(parts) < 2:
+            bot.reply_to(message, "Usage: /backfill_x <username> [count]")
+            return
 
-            if count == 0:
-                bot.send_message(
-                    CHAT_ID, f"No new posts found for {username} on Instagram."
-                )
+        username = parts[1].strip().lower().lstrip("@")
+        count = fetchers.X_BACKFILL_LIMIT
+        if len(parts) > 2:
+            if not parts[2].isdigit() or int(parts[2]) < 1:
+                bot.reply_to(message, f"Invalid count: {parts[2]}")
                 return
+            count = min(int(parts[2]), fetchers.X_BACKFILL_LIMIT)
 
-            for post in insta_posts:
-                if post.get("media_paths"):
-                    utils.send_to_telegram(
-                        f"{post['content']}\n\n{post['url']}",
-                        media_paths=post.get("media_paths"),
-                        media_types=post.get("media_types"),
-                    )
-                else:
-                    utils.send_to_telegram(
-                        f"{post['content']}\n\n{post['url']}",
-                        media_url=post.get("media_url"),
-                    )
-
-            for story in insta_stories:
-                if story.get("media_paths"):
-                    utils.send_to_telegram(
-                        f"{story['content']}",
-                        media_paths=story.get("media_paths"),
-                        media_types=story.get("media_types"),
-                    )
-                else:
-                    utils.send_to_telegram(
-                        f"{story['content']}",
-                        media_url=story.get("url"),
-                    )
-
-            bot.send_message(
-                CHAT_ID,
-                f"Fetched {len(insta_posts)} posts and {len(insta_stories)} stories from Instagram user {username}.",
-            )
-        else:
-            bot.reply_to(
-                message, f"Unknown platform '{platform}'. Use 'x' or 'instagram'."
-            )
+        job_manager.submit(
+            "backfill",
+            message.chat.id,
+            f"backfill of up to {count} X posts for {username}",
+            username=username,
+            count=count,
+        )
     except Exception as e:
-        bot.send_message(CHAT_ID, f"Error in /fetch command: {e}")
+        bot.send_message(CHAT_ID, f"Error in /backfill_x command: {e}")
 
 
 @bot.message_handler(commands=["fetch_nagi"])
@@ -515,32 +615,32 @@ def handle_fetch_nagi(message):
             return
 
         for post in new_posts:
-            utils.send_to_telegram(
+            utils.queue_to_telegram(
                 f"{post['content']}\n\n{post['url']}",
                 media_paths=post.get("media_paths"),
                 media_types=post.get("media_types"),
             )
         for post in insta_posts:
             if post.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_paths=post.get("media_paths"),
                     media_types=post.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_url=post.get("media_url"),
                 )
         for story in insta_stories:
             if story.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}",
                     media_paths=story.get("media_paths"),
                     media_types=story.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}", media_url=story.get("url")
                 )
         bot.send_message(CHAT_ID, f"Fetched {count} new posts for nagi_italy.")
@@ -559,7 +659,7 @@ def handle_fetch_nagi_x(message):
             return
 
         for post in new_posts:
-            utils.send_to_telegram(
+            utils.queue_to_telegram(
                 f"{post['content']}\n\n{post['url']}",
                 media_paths=post.get("media_paths"),
                 media_types=post.get("media_types"),
@@ -588,26 +688,26 @@ def handle_fetch_nagi_ig(message):
 
         for post in insta_posts:
             if post.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_paths=post.get("media_paths"),
                     media_types=post.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{post['content']}\n\n{post['url']}",
                     media_url=post.get("media_url"),
                 )
 
         for story in insta_stories:
             if story.get("media_paths"):
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}",
                     media_paths=story.get("media_paths"),
                     media_types=story.get("media_types"),
                 )
             else:
-                utils.send_to_telegram(
+                utils.queue_to_telegram(
                     f"{story['content']}",
                     media_url=story.get("url"),
                 )
@@ -634,6 +734,51 @@ def handle_echo(message):
         bot.reply_to(message, f"Error in echo function: {e}")
 
 
+@bot.message_handler(commands=["jobs"])
+def handle_jobs(message):
+    """List queued, running and recently finished background jobs"""
+    rows = job_manager.list_jobs()
+    if not rows:
+        bot.reply_to(message, "No jobs yet.")
+        return
+    lines = [
+        f"#{r['id']} [{r['status']}] {r['kind']}: {r['description']}" for r in rows
+    ]
+    bot.reply_to(message, "\n".join(lines))
+
+
+@bot.message_handler(commands=["cancel"])
+def handle_cancel(message):
+    parts = message.text.split()
+    if len(parts) != 2 or not parts[1].lstrip("#").isdigit():
+        bot.reply_to(message, "Usage: /cancel <job_id>")
+        return
+    job_id = int(parts[1].lstrip("#"))
+    status = job_manager.cancel(job_id)
+    if status is None:
+        bot.reply_to(message, f"No job #{job_id}.")
+    elif status in ("cancelled", "cancelling"):
+        bot.reply_to(message, f"Job #{job_id} {status}.")
+    else:
+        bot.reply_to(message, f"Job #{job_id} is already {status}.")
+
+
+@bot.message_handler(commands=["media_report"])
+def handle_media_report(message):
+    """Show how much disk space the content-addressed media store saves"""
+    try:
+        stats = utils.get_blob_store().report()
+        mb = 1024 * 1024
+        bot.reply_to(
+            message,
+            f"Media blobs: {stats['blobs']} ({stats['stored_bytes'] / mb:.1f} MB on disk)\n"
+            f"Media paths linked to them: {stats['references']}\n"
+            f"Saved by dedup: {stats['saved_bytes'] / mb:.1f} MB",
+        )
+    except Exception as e:
+        bot.reply_to(message, f"Error building media report: {e}")
+
+
 @bot.message_handler(commands=["history"])
 def handle_history(message):
     """Browse previously fetched posts"""
@@ -665,61 +810,9 @@ def history_select_platform_callback(call):
     user_id = call.from_user.id
     chat_id = call.message.chat.id
 
+    # Answered from the in-memory account cache, no disk access
     accounts = utils.get_accounts_by_platform(platform)
 
-    if not accounts:
-        try:
-            platform_dir_map = {
-                "twitter": TWITTER_MEDIA_DIR,
-                "instagram_posts": INSTAGRAM_POSTS_DIR,
-                "instagram_stories": INSTAGRAM_STORIES_DIR,
-                "bilibili": BILIBILI_MEDIA_DIR,
-            }
-
-            if platform in platform_dir_map:
-                media_dir = platform_dir_map[platform]
-
-                if os.path.exists(media_dir):
-                    accounts = [
-                        d
-                        for d in os.listdir(media_dir)
-                        if os.path.isdir(os.path.join(media_dir, d))
-                    ]
-
-                    if platform == "instagram_stories" and not accounts:
-                        stories_pattern_dirs = [
-                            os.path.join(MEDIA_DIR, "instagram", "stories"),
-                            os.path.join(MEDIA_DIR, "instagram"),
-                        ]
-
-                        for dir_path in stories_pattern_dirs:
-                            if os.path.exists(dir_path):
-                                for d in os.listdir(dir_path):
-                                    full_path = os.path.join(dir_path, d)
-                                    if os.path.isdir(full_path) and (
-                                        d.startswith("stories_")
-                                        or "stories" in dir_path
-                                    ):
-                                        accounts.append(d.replace("stories_", ""))
-
-                        if accounts:
-                            seen = set()
-                            accounts = [
-                                x for x in accounts if not (x in seen or seen.add(x))
-                            ]
-
-                    if not accounts:
-                        if platform == "instagram_stories":
-                            accounts = ["nagi.i_official"]
-                        elif platform == "twitter":
-                            accounts = [X_USERNAME]
-                        elif platform == "instagram_posts":
-                            accounts = [INSTAGRAM_USERNAME]
-        except Exception as e:
-            import traceback
-
-            traceback.print_exc()
-
     if not accounts:
         bot.edit_message_text(
             f"No accounts found for {platform.replace('_', ' ')}. Fetch some content first!\n",
@@ -762,6 +855,33 @@ def history_select_platform_callback(call):
     bot.answer_callback_query(call.id)
 
 
+def _load_history_posts(platform_type, post_list_key, platform_key):
+    if platform_type == "bilibili":
+        posts = utils.get_sent_videos(mapping_prefix=platform_key)
+    else:
+        posts = utils.get_seen_posts(post_list_key, mapping_prefix=platform_key)
+
+    if not posts:
+        if post_list_key:
+            posts = utils.get_seen_posts(post_list_key)
+        elif platform_type == "bilibili":
+            posts = utils.get_sent_videos()
+    return list(posts)
+
+
+def history_posts(platform_type, post_list_key, platform_key, refresh=False):
+    """
+    An account's post IDs for /history, shared by everyone paging through
+    them. refresh reloads them, so opening an account shows new posts.
+    """
+    key = f"history:{platform_type}:{post_list_key}:{platform_key}"
+    if refresh:
+        menu_cache.pop(key, None)
+    return menu_cache.get_or_load(
+        key, lambda: _load_history_posts(platform_type, post_list_key, platform_key)
+    )
+
+
 @bot.callback_query_handler(
     func=lambda call: call.data.startswith("history_select_account_")
 )
@@ -786,8 +906,6 @@ def history_select_account_callback(call):
         account = account.replace("stories_", "", 1)
         platform += "_stories"
 
-    sent_posts = utils.load_sent_posts()
-
     if platform in ["twitter", "x"]:
         platform_type = "twitter"
         post_list_key = "x_posts"
@@ -812,41 +930,7 @@ def history_select_account_callback(call):
         bot.answer_callback_query(call.id, f"Unknown platform: {platform}")
         return
 
-    if platform_type == "twitter":
-        posts = [
-            p
-            for p in sent_posts.get("x_posts", [])
-            if f"twitter_{account}_{p}" in sent_posts.get("media_mapping", {})
-        ]
-    elif platform_type == "instagram_posts":
-        posts = [
-            p
-            for p in sent_posts.get("instagram_posts", [])
-            if f"instagram_post_{account}_{p}" in sent_posts.get("media_mapping", {})
-        ]
-    elif platform_type == "instagram_stories":
-        posts = [
-            p
-            for p in sent_posts.get("instagram_stories", [])
-            if f"instagram_story_{account}_{p}" in sent_posts.get("media_mapping", {})
-        ]
-    elif platform_type == "bilibili":
-        sent_videos = utils.load_sent_videos()
-        posts = [
-            p
-            for p in sent_videos.get("videos", [])
-            if f"bilibili_{account}_{p}" in sent_posts.get("media_mapping", {})
-        ]
-    else:
-        bot.answer_callback_query(call.id, f"Unsupported platform: {platform}")
-        return
-
-    if not posts:
-        if post_list_key and post_list_key in sent_posts:
-            posts = sent_posts.get(post_list_key, [])
-        elif platform_type == "bilibili":
-            sent_videos = utils.load_sent_videos()
-            posts = sent_videos.get("videos", [])
+    posts = history_posts(platform_type, post_list_key, platform_key, refresh=True)
 
     if not posts:
         bot.edit_message_text(
@@ -869,7 +953,7 @@ def history_select_account_callback(call):
         "platform": platform_type,
         "platform_key": platform_key,
         "account": account,
-        "posts": posts,
+        "post_list_key": post_list_key,
         "current_page": 0,
         "posts_per_page": 5,
     }
@@ -927,7 +1011,9 @@ def show_posts_page(user_id, chat_id, message_id):
     state = user_states.get(user_id, {})
     platform = state.get("platform", "")
     account = state.get("account", "")
-    posts = state.get("posts", [])
+    posts = history_posts(
+        platform, state.get("post_list_key"), state.get("platform_key")
+    )
     current_page = state.get("current_page", 0)
     posts_per_page = state.get("posts_per_page", 5)
 
@@ -1018,155 +1104,17 @@ def view_post_callback(call):
     user_id = call.from_user.id
     chat_id = call.message.chat.id
 
-    platform_key = f"{user_states[user_id].get('platform_key', '')}_{post_id}"
-    media_paths = utils.get_post_media_files(platform_key, post_id)
+    platform_key = user_states.get(user_id, {}).get("platform_key")
+    media_paths = []
+    if platform_key:
+        media_paths = utils.get_post_media_files(platform_key, post_id)
 
     if not media_paths:
-        base_platform = ""
-        if platform == "twitter":
-            base_platform = "twitter"
-        elif platform == "instagram_posts":
-            base_platform = "instagram_post"
-        elif platform == "instagram_stories":
-            base_platform = "instagram_story"
-        elif platform == "bilibili":
-            base_platform = "bilibili"
-
-        media_paths = utils.get_post_media_files(base_platform, post_id)
-
-    if not media_paths:
-        try:
-            if platform == "twitter":
-                post_dir = os.path.join(TWITTER_MEDIA_DIR, account, post_id)
-
-                if os.path.exists(post_dir):
-                    media_paths = [
-                        os.path.join(post_dir, f)
-                        for f in os.listdir(post_dir)
-                        if os.path.isfile(os.path.join(post_dir, f))
-                        and (
-                            f.endswith(".jpg")
-                            or f.endswith(".jpeg")
-                            or f.endswith(".png")
-                            or f.endswith(".mp4")
-                        )
-                    ]
-
-            elif platform == "instagram_posts":
-                post_dir = os.path.join(INSTAGRAM_POSTS_DIR, account, post_id)
-
-                if os.path.exists(post_dir):
-                    media_paths = [
-                        os.path.join(post_dir, f)
-                        for f in os.listdir(post_dir)
-                        if os.path.isfile(os.path.join(post_dir, f))
-                        and (
-                            f.endswith(".jpg")
-                            or f.endswith(".jpeg")
-                            or f.endswith(".png")
-                            or f.endswith(".mp4")
-                        )
-                    ]
-                else:
-                    alt_accounts = [
-                        account.replace(".", "_"),
-                        account.replace("_", "."),
-                        f"posts_{account}",
-                    ]
-
-                    for alt_account in alt_accounts:
-                        alt_dir = os.path.join(
-                            INSTAGRAM_POSTS_DIR, alt_account, post_id
-                        )
-                        if os.path.exists(alt_dir):
-                            media_paths = [
-                                os.path.join(alt_dir, f)
-                                for f in os.listdir(alt_dir)
-                                if os.path.isfile(os.path.join(alt_dir, f))
-                                and (
-                                    f.endswith(".jpg")
-                                    or f.endswith(".jpeg")
-                                    or f.endswith(".png")
-                                    or f.endswith(".mp4")
-                                )
-                            ]
-                            if media_paths:
-                                break
-
-            elif platform == "instagram_stories":
-                post_dir = os.path.join(INSTAGRAM_STORIES_DIR, account, post_id)
-
-                if os.path.exists(post_dir):
-                    media_paths = [
-                        os.path.join(post_dir, f)
-                        for f in os.listdir(post_dir)
-                        if os.path.isfile(os.path.join(post_dir, f))
-                        and (
-                            f.endswith(".jpg")
-                            or f.endswith(".jpeg")
-                            or f.endswith(".png")
-                            or f.endswith(".mp4")
-                        )
-                    ]
-                else:
-                    alt_accounts = [
-                        account.replace(".", "_"),
-                        account.replace("_", "."),
-                        f"stories_{account}",
-                    ]
-
-                    for alt_account in alt_accounts:
-                        alt_dir = os.path.join(
-                            INSTAGRAM_STORIES_DIR, alt_account, post_id
-                        )
-                        if os.path.exists(alt_dir):
-                            media_paths = [
-                                os.path.join(alt_dir, f)
-                                for f in os.listdir(alt_dir)
-                                if os.path.isfile(os.path.join(alt_dir, f))
-                                and (
-                                    f.endswith(".jpg")
-                                    or f.endswith(".jpeg")
-                                    or f.endswith(".png")
-                                    or f.endswith(".mp4")
-                                )
-                            ]
-                            if media_paths:
-                                break
-
-            elif platform == "bilibili":
-                post_dir = os.path.join(BILIBILI_MEDIA_DIR, account, post_id)
-
-                if os.path.exists(post_dir):
-                    media_paths = [
-                        os.path.join(post_dir, f)
-                        for f in os.listdir(post_dir)
-                        if os.path.isfile(os.path.join(post_dir, f))
-                        and f.endswith(".mp4")
-                    ]
-                # alternate account search, similar to Instagram
-                else:
-                    alt_accounts = [
-                        account.replace(".", "_"),
-                        account.replace("_", "."),
-                    ]
-
-                    for alt_account in alt_accounts:
-                        alt_dir = os.path.join(BILIBILI_MEDIA_DIR, alt_account, post_id)
-                        if os.path.exists(alt_dir):
-                            media_paths = [
-                                os.path.join(alt_dir, f)
-                                for f in os.listdir(alt_dir)
-                                if os.path.isfile(os.path.join(alt_dir, f))
-                                and f.endswith(".mp4")
-                            ]
-                            if media_paths:
-                                break
-
-        except Exception as e:
-            import traceback
-
-            traceback.print_exc()
+        # The media index covers files whose account directory is spelled
+        # differently (dots vs underscores, "posts_" prefixes, ...)
+        media_paths = utils.find_post_media(platform, post_id, account)
+        if not media_paths:
+            media_paths = utils.find_post_media(platform, post_id)
 
     if not media_paths:
         bot.answer_callback_query(
@@ -1218,35 +1166,13 @@ def view_post_callback(call):
     )
 
     try:
+        # Previously sent files go out by file_id, without another upload
         if len(media_paths) == 1:
-            media_path = media_paths[0]
-            mtype = media_types[0]
-            if mtype == "video":
-                with open(media_path, "rb") as vid:
-                    bot.send_video(chat_id, vid, caption=caption, reply_markup=markup)
-            else:
-                with open(media_path, "rb") as img:
-                    bot.send_photo(chat_id, img, caption=caption, reply_markup=markup)
+            utils.send_media(
+                chat_id, media_paths, media_types, caption=caption, reply_markup=markup
+            )
         else:
-            media = []
-            for i, path in enumerate(media_paths):
-                mtype = media_types[i]
-                if mtype == "video":
-                    with open(path, "rb") as vid:
-                        media.append(
-                            telebot.types.InputMediaVideo(
-                                vid, caption=caption if i == 0 else None
-                            )
-                        )
-                else:
-                    with open(path, "rb") as img:
-                        media.append(
-                            telebot.types.InputMediaPhoto(
-                                img, caption=caption if i == 0 else None
-                            )
-                        )
-
-            bot.send_media_group(chat_id, media)
+            utils.send_media(chat_id, media_paths, media_types, caption=caption)
             bot.send_message(
                 chat_id, "Use the button below to navigate:", reply_markup=markup
             )
@@ -1257,6 +1183,31 @@ def view_post_callback(call):
     bot.answer_callback_query(call.id)
 
 
+NEWS_SOURCES = {
+    "saku": sakurazaka_news,
+    "hinata": hinatazaka_news,
+    "nogi": nogi_news,
+}
+
+
+def monthly_news(site, year, month, menu, refresh=False):
+    """
+    A month's news list for site. Past months are fetched once and shared by
+    all open menus. The current month is still growing, so each menu (its
+    "chat_id:message_id") keeps its own snapshot to page and index into;
+    refresh takes a new one, so reopening the month shows new articles.
+    """
+    key = f"news:{site}:{year}:{month}"
+    now = datetime.now()
+    if (year, month) >= (now.year, now.month):
+        key = f"{key}:{menu}"
+        if refresh:
+            menu_cache.pop(key, None)
+    return menu_cache.get_or_load(
+        key, lambda: NEWS_SOURCES[site].fetch_monthly_news(year, month)
+    )
+
+
 @bot.message_handler(commands=["saku_news"])
 def handle_saku_news(message):
     """Step 1: Ask the user to pick a year."""
@@ -1323,13 +1274,18 @@ def saku_month_callback(call):
     _, _, year_str, month_str = parts
     yr, mo = int(year_str), int(month_str)
 
-    news_items = sakurazaka_news.fetch_monthly_news(yr, mo)
+    news_items = monthly_news(
+        "saku",
+        yr,
+        mo,
+        f"{call.message.chat.id}:{call.message.message_id}",
+        refresh=True,
+    )
     if not news_items:
         bot.send_message(call.message.chat.id, "No news found for that month.")
         return
 
     user_states[call.from_user.id] = {
-        "saku_news": news_items,
         "saku_news_page": 0,
         "saku_year": yr,
         "saku_month": mo,
@@ -1345,7 +1301,7 @@ def saku_month_callback(call):
 def saku_news_page_nav_callback(call):
     bot.answer_callback_query(call.id)
     uid = call.from_user.id
-    if uid not in user_states or "saku_news" not in user_states[uid]:
+    if uid not in user_states or "saku_year" not in user_states[uid]:
         return
     if call.data == "saku_news_prev_page":
         user_states[uid]["saku_news_page"] -= 1
@@ -1357,10 +1313,10 @@ def saku_news_page_nav_callback(call):
 def show_saku_news_page(user_id, chat_id, message_id, items_per_page=10):
     if user_id not in user_states:
         return
-    all_news = user_states[user_id].get("saku_news", [])
     current_page = user_states[user_id].get("saku_news_page", 0)
     yr = user_states[user_id].get("saku_year")
     mo = user_states[user_id].get("saku_month")
+    all_news = monthly_news("saku", yr, mo, f"{chat_id}:{message_id}")
     start_idx = current_page * items_per_page
     end_idx = min(start_idx + items_per_page, len(all_news))
     page_news = all_news[start_idx:end_idx]
@@ -1397,9 +1353,15 @@ def saku_detail_callback(call):
     idx = int(call.data.split("_")[2])
     if (
         call.from_user.id in user_states
-        and "saku_news" in user_states[call.from_user.id]
+        and "saku_year" in user_states[call.from_user.id]
     ):
-        news_items = user_states[call.from_user.id]["saku_news"]
+        state = user_states[call.from_user.id]
+        news_items = monthly_news(
+            "saku",
+            state["saku_year"],
+            state["saku_month"],
+            f"{call.message.chat.id}:{call.message.message_id}",
+        )
         if 0 <= idx < len(news_items):
             bot.send_message(call.message.chat.id, "Fetching details, please wait...")
             news_item = news_items[idx]
@@ -1512,13 +1474,18 @@ def hinata_month_callback(call):
 
     bot.answer_callback_query(call.id, text="Fetching news, please wait...")
 
-    news_items = hinatazaka_news.fetch_monthly_news(yr, mo)
+    news_items = monthly_news(
+        "hinata",
+        yr,
+        mo,
+        f"{call.message.chat.id}:{call.message.message_id}",
+        refresh=True,
+    )
     if not news_items:
         bot.send_message(call.message.chat.id, "No news found for that month.")
         return
 
     user_states[call.from_user.id] = {
-        "hinata_news": news_items,
         "hinata_news_page": 0,
         "hinata_year": yr,
         "hinata_month": mo,
@@ -1534,7 +1501,7 @@ def hinata_month_callback(call):
 def hinata_news_page_nav_callback(call):
     bot.answer_callback_query(call.id)
     uid = call.from_user.id
-    if uid not in user_states or "hinata_news" not in user_states[uid]:
+    if uid not in user_states or "hinata_year" not in user_states[uid]:
         return
     if call.data == "hinata_news_prev_page":
         user_states[uid]["hinata_news_page"] -= 1
@@ -1546,10 +1513,10 @@ def hinata_news_page_nav_callback(call):
 def show_hinata_news_page(user_id, chat_id, message_id, items_per_page=10):
     if user_id not in user_states:
         return
-    all_news = user_states[user_id].get("hinata_news", [])
     current_page = user_states[user_id].get("hinata_news_page", 0)
     yr = user_states[user_id].get("hinata_year")
     mo = user_states[user_id].get("hinata_month")
+    all_news = monthly_news("hinata", yr, mo, f"{chat_id}:{message_id}")
     start_idx = current_page * items_per_page
     end_idx = min(start_idx + items_per_page, len(all_news))
     page_news = all_news[start_idx:end_idx]
@@ -1588,9 +1555,15 @@ def hinata_detail_callback(call):
     idx = int(call.data.split("_")[2])
     if (
         call.from_user.id in user_states
-        and "hinata_news" in user_states[call.from_user.id]
+        and "hinata_year" in user_states[call.from_user.id]
     ):
-        news_items = user_states[call.from_user.id]["hinata_news"]
+        state = user_states[call.from_user.id]
+        news_items = monthly_news(
+            "hinata",
+            state["hinata_year"],
+            state["hinata_month"],
+            f"{call.message.chat.id}:{call.message.message_id}",
+        )
         if 0 <= idx < len(news_items):
             bot.send_message(call.message.chat.id, "Fetching details, please wait...")
             news_item = news_items[idx]
@@ -1700,13 +1673,18 @@ def nogi_month_callback(call):
 
     bot.answer_callback_query(call.id, text="Fetching news, please wait...")
 
-    news_items = nogi_news.fetch_monthly_news(yr, mo)
+    news_items = monthly_news(
+        "nogi",
+        yr,
+        mo,
+        f"{call.message.chat.id}:{call.message.message_id}",
+        refresh=True,
+    )
     if not news_items:
         bot.send_message(call.message.chat.id, "No news found for that month.")
         return
 
     user_states[call.from_user.id] = {
-        "nogi_news": news_items,
         "nogi_news_page": 0,
         "nogi_year": yr,
         "nogi_month": mo,
@@ -1722,7 +1700,7 @@ def nogi_month_callback(call):
 def nogi_news_page_nav_callback(call):
     bot.answer_callback_query(call.id)
     uid = call.from_user.id
-    if uid not in user_states or "nogi_news" not in user_states[uid]:
+    if uid not in user_states or "nogi_year" not in user_states[uid]:
         return
     if call.data == "nogi_news_prev_page":
         user_states[uid]["nogi_news_page"] -= 1
@@ -1735,10 +1713,10 @@ def show_nogi_news_page(user_id, chat_id, message_id, items_per_page=10):
     if user_id not in user_states:
         return
 
-    all_news = user_states[user_id].get("nogi_news", [])
     current_page = user_states[user_id].get("nogi_news_page", 0)
     yr = user_states[user_id].get("nogi_year")
     mo = user_states[user_id].get("nogi_month")
+    all_news = monthly_news("nogi", yr, mo, f"{chat_id}:{message_id}")
 
     start_idx = current_page * items_per_page
     end_idx = min(start_idx + items_per_page, len(all_news))
@@ -1776,9 +1754,15 @@ def nogi_detail_callback(call):
     idx = int(call.data.split("_")[2])
     if (
         call.from_user.id in user_states
-        and "nogi_news" in user_states[call.from_user.id]
+        and "nogi_year" in user_states[call.from_user.id]
     ):
-        news_items = user_states[call.from_user.id]["nogi_news"]
+        state = user_states[call.from_user.id]
+        news_items = monthly_news(
+            "nogi",
+            state["nogi_year"],
+            state["nogi_month"],
+            f"{call.message.chat.id}:{call.message.message_id}",
+        )
         if 0 <= idx < len(news_items):
             bot.send_message(call.message.chat.id, "Fetching details, please wait...")
             news_item = news_items[idx]
@@ -1824,6 +1808,7 @@ def handle_help(message):
 Available commands:
 /pick - Interactive menu to fetch posts (recommended)
 /fetch [x|instagram] <username> - Fetch posts by platform and username
+/backfill_x <username> [count] - Save older X posts of an account into the history
 /fetch_nagi - Fetch all posts for Inoue Nagi
 /fetch_nagi_x - Fetch only X/Twitter posts for Inoue Nagi
 /fetch_nagi_ig - Fetch only Instagram posts for Inoue Nagi
@@ -1835,6 +1820,9 @@ Available commands:
 /auto_status - Check auto fetch status
 /auto_config - Configure auto fetch settings
 /echo <message> - Echo back your message
+/media_report - Show disk space saved by media dedup
+/jobs - List background jobs
+/cancel <job_id> - Cancel a queued or running job
 /nogi_news - Fetch Nogizaka46 news by month
 /saku_news - Fetch Sakurazaka46 news by month
 /hinata_news - Fetch Hinatazaka46 news by month
@@ -1950,32 +1938,34 @@ def handle_url_message(message):
     if not urls:
         return
 
-    for url in urls:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.lower()
-
-        # Instagram
-        if "instagram.com" in domain:
-            process_instagram_url(message, url, parsed_url)
-
-        # Twitter/X
-        elif "twitter.com" in domain or "x.com" in domain:
-            process_x_url(message, url, parsed_url)
-
-        # Threads
-        elif "threads.net" in domain:
-            process_threads_url(message, url, parsed_url)
+    job_manager.submit("url", message.chat.id, ", ".join(urls), message=message.json)
 
 
 if __name__ == "__main__":
     print("Bot started. Listening for commands...")
-    # start auto-fetch by default
+    # deliver messages left in the send queue by the previous run
+    utils.get_send_queue()
+    job_manager = jobs.JobManager(utils.get_store().store, bot, JOB_HANDLERS)
+    job_manager.start()
+    threading.Thread(target=run_startup_scans, daemon=True).start()
+    # resume auto fetch if it was running when the bot stopped; accounts
+    # whose checks were missed meanwhile are spread out, not run at once
     try:
-        raise Exception("Auto fetch not started by default")
-        if start_auto_fetch():
+        auto_fetch_enabled = load_auto_fetch_config()
+        auto_fetch_scheduler = scheduler.Scheduler(
+            fetch_account, auto_fetch_interval, store=utils.get_store().store
+        )
+        if auto_fetch_enabled and start_auto_fetch():
             print(
-                f"Auto fetch started. Will check for new posts every {auto_fetch_interval//60} minutes."
+                f"Auto fetch resumed. Checking accounts every {auto_fetch_interval//60} minutes or as adapted."
             )
     except Exception as e:
         print(f"Failed to start auto fetch: {e}")
-    bot.polling()
+    if BOT_MODE == "webhook":
+        webhook_server.run(bot)
+    else:
+        # getUpdates is refused while a webhook is registered
+        bot.remove_webhook()
+        # Exit normally on SIGTERM so atexit flushes the pending state
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        bot.polling()
@@ -0,0 +1,77 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import utils
+
+# Total concurrent downloads, and concurrent downloads against a single host
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+
+_lock = threading.Lock()
+_executor = None
+_host_active = {}  # host -> downloads of it in the pool
+_host_pending = {}  # host -> deque of (url, path, future) waiting for a slot
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download"
+            )
+        return _executor
+
+
+def _download(host, url, path, future):
+    try:
+        if future.set_running_or_notify_cancel():
+            future.set_result(utils.download_media(url, path))
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        # Hand this host's slot to its next queued download, if any
+        with _lock:
+            pending = _host_pending.get(host)
+            if pending:
+                job = pending.popleft()
+            else:
+                job = None
+                _host_active[host] -= 1
+        if job:
+            _get_executor().submit(_download, host, *job)
+
+
+def submit(url, path):
+    """
+    Queue a download of url to path. Returns a Future resolving to True on
+    success; an existing file resolves immediately.
+
+    At most DOWNLOAD_PER_HOST downloads of one host are handed to the pool at
+    a time; the rest wait in a per-host queue, so a host with many queued
+    downloads doesn't tie up workers other hosts could use.
+    """
+    future = Future()
+    if os.path.exists(path):
+        future.set_result(True)
+        return future
+    host = urlparse(url).netloc.lower()
+    with _lock:
+        if _host_active.get(host, 0) >= DOWNLOAD_PER_HOST:
+            _host_pending.setdefault(host, deque()).append((url, path, future))
+            return future
+        _host_active[host] = _host_active.get(host, 0) + 1
+    _get_executor().submit(_download, host, url, path, future)
+    return future
+
+
+def download_all(jobs):
+    """
+    Download (url, path) pairs concurrently. Returns success flags in the same
+    order as jobs, so album order is preserved.
+    """
+    futures = [submit(url, path) for url, path in jobs]
+    return [future.result() for future in futures]
@@ -3,21 +3,31 @@ import time
 import random
 import requests
 import json
-import instaloader
 import traceback
+import threading
 import re
 import uuid
+from datetime import datetime
 from dotenv import load_dotenv
 
 import utils
+import http_client
+import download_pool
+import twitter_budget
 
 from glob import glob
 from os.path import expanduser
 from platform import system
 from sqlite3 import OperationalError, connect
-from instaloader.exceptions import QueryReturnedBadRequestException
 
+# False once logging in has failed; L is created by get_instagram_loader()
 INSTAGRAM_AVAILABLE = True
+L = None
+_instagram_lock = threading.Lock()
+
+
+class FetchFailed(Exception):
+    """An account could not be fetched; raised by fetchers given raise_errors"""
 
 
 def import_session_cookies_from_firefox(sessionfile):
@@ -58,6 +68,7 @@ def import_session_cookies_from_firefox(sessionfile):
 
 def attempt_instagram_login(max_retries=1):
     global INSTAGRAM_AVAILABLE
+    import instaloader
 
     # Try Firefox cookies first as it's more likely to work without triggering security checkpoints
     print("Trying to use Firefox cookies for Instagram login first...")
@@ -116,7 +127,6 @@ def attempt_instagram_login(max_retries=1):
 load_dotenv()
 
 MEDIA_DIR = utils.MEDIA_DIR
-SENT_POSTS_FILE = utils.SENT_POSTS_FILE
 TWITTER_CACHE_FILE = utils.TWITTER_CACHE_FILE
 TWITTER_CACHE_EXPIRY = utils.TWITTER_CACHE_EXPIRY
 bot = utils.bot
@@ -127,12 +137,17 @@ TWITTER_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")
 TWITTER_API_SECRET = os.getenv("TWITTER_API_SECRET")
 TWITTER_ACCESS_TOKEN = os.getenv("TWITTER_ACCESS_TOKEN")
 TWITTER_ACCESS_SECRET = os.getenv("TWITTER_ACCESS_SECRET")
+# Most new posts one poll pages through after the last seen one; a burst
+# beyond this loses its oldest posts
+X_MAX_NEW_POSTS = int(os.getenv("X_MAX_NEW_POSTS", "300"))
+# Most posts a backfill may go back (the API serves the latest 3200)
+X_BACKFILL_LIMIT = int(os.getenv("X_BACKFILL_LIMIT", "800"))
+# Posts taken on the first poll of an account, before it has a high-water mark
+X_FIRST_FETCH = 10
 
 INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
 INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")
 
-L = instaloader.Instaloader()
-attempt_instagram_login()
 
 if not os.path.exists(MEDIA_DIR):
     try:
@@ -142,243 +157,374 @@ if not os.path.exists(MEDIA_DIR):
         print(f"Failed to create media directory {MEDIA_DIR}: {e}")
 
 
-def download_media(url, path, retries=3, timeout=10):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+def get_instagram_loader():
+    """
+    Return the shared Instaloader, logging in to Instagram on first use.
+    Returns None if Instagram is unavailable because the login failed.
+    """
+    global L
+    with _instagram_lock:
+        if L is None and INSTAGRAM_AVAILABLE:
+            import instaloader
+
+            L = instaloader.Instaloader()
+            attempt_instagram_login()
+        return L if INSTAGRAM_AVAILABLE else None
 
+
+def twitter_get(
+    endpoint, url, headers, params=None, priority=twitter_budget.MANUAL, retries=3
+):
+    """
+    GET a Twitter API endpoint within its rate limit budget. Raises
+    twitter_budget.RateLimited instead of waiting when the budget is used
+    up; returns None if every attempt failed with a network error.
+    """
     for attempt in range(retries):
+        twitter_budget.budget.reserve(endpoint, priority)
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            response = requests.get(url, headers=headers, stream=True, timeout=timeout)
-            if response.status_code == 200:
-                try:
-                    with open(path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    print(f"Downloaded media to {path}")
-                    return True
-                except PermissionError:
-                    print(f"Permission denied to write to {path}")
-                    return False
-                except FileNotFoundError:
-                    print(
-                        f"Directory not found for {path}. Ensure {os.path.dirname(path)} exists."
-                    )
-                    return False
-                except OSError as e:
-                    print(f"OS error writing to {path}: {e}")
-                    return False
-            else:
-                print(f"Attempt {attempt+1}: HTTP {response.status_code}")
-        except (
-            requests.exceptions.RequestException,
-            requests.exceptions.SSLError,
-        ) as e:
-            print(f"Attempt {attempt+1}: Error downloading media {url}: {e}")
-        time.sleep(2)
-    print(f"Failed to download media {url} after {retries} attempts")
-    return False
-
-
-def get_twitter_user_id(username, headers, max_retries=3):
-    clean_username = username.replace("@", "")
-    user_url = f"https://api.twitter.com/2/users/by/username/{clean_username}"
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(user_url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                return response.json()["data"]["id"]
-            elif response.status_code == 429:
-                reset_time = int(
-                    response.headers.get("x-rate-limit-reset", time.time() + 900)
-                )  # Default 15 min
-                wait_time = max(reset_time - time.time(), 1)
-                reset_datetime = time.ctime(reset_time)
-                print(
-                    f"Rate limit exceeded. Waiting {wait_time:.0f} seconds until {reset_datetime}"
-                )
-                if CHAT_ID:
-                    bot.send_message(
-                        CHAT_ID,
-                        f"Twitter API rate limit reached for @{clean_username}. Waiting {wait_time:.0f} seconds until {reset_datetime}.",
-                    )
-                time.sleep(wait_time)
-            else:
-                print(f"Failed to get user ID: HTTP {response.status_code}")
-                return None
+            response = http_client.get(url, headers=headers, params=params, timeout=10)
         except requests.exceptions.RequestException as e:
-            print(f"Attempt {attempt+1}: Error fetching user ID: {e}")
+            print(f"Attempt {attempt+1}: Error calling Twitter {endpoint}: {e}")
             time.sleep(2**attempt)
-    print(f"Failed to get user ID for {clean_username} after {max_retries} attempts")
-    if CHAT_ID:
-        bot.send_message(
-            CHAT_ID,
-            f"Failed to fetch Twitter user ID for @{clean_username} after {max_retries} attempts due to rate limits or errors.",
+            continue
+        twitter_budget.budget.update(endpoint, response)
+        return response
+    return None
+
+
+def get_twitter_user_id(
+    username, headers, max_retries=3, priority=twitter_budget.MANUAL
+):
+    clean_username = username.replace("@", "")
+    # User IDs never change, so each account is only looked up once
+    cache_key = f"twitter_user_id:{clean_username.lower()}"
+    cached = utils.get_store().get_meta(cache_key)
+    if cached:
+        return cached
+
+    user_url = f"https://api.twitter.com/2/users/by/username/{clean_username}"
+    response = twitter_get(
+        "users/by/username", user_url, headers, priority=priority, retries=max_retries
+    )
+    if response is None:
+        print(
+            f"Failed to get user ID for {clean_username} after {max_retries} attempts"
         )
+        if CHAT_ID:
+            bot.send_message(
+                CHAT_ID,
+                f"Failed to fetch Twitter user ID for @{clean_username} after {max_retries} attempts due to network errors.",
+            )
+        return None
+    if response.status_code != 200:
+        print(f"Failed to get user ID: HTTP {response.status_code}")
+        return None
+    user_id = response.json()["data"]["id"]
+    utils.get_store().set_meta(cache_key, user_id)
+    return user_id
+
+
+def fetch_x_timeline(user_id, headers, params, max_tweets, priority):
+    """
+    Page through a user's tweets, newest first, following pagination_token
+    until max_tweets are collected or there are no more. Returns
+    (tweets, media by media_key, whether more pages were left), or None if a
+    request failed.
+    """
+    tweets_url = f"https://api.twitter.com/2/users/{user_id}/tweets"
+    params = dict(params, max_results=min(100, max(5, max_tweets)))
+    tweets = []
+    media = {}
+    while True:
+        response = twitter_get(
+            "users/tweets", tweets_url, headers, params=params, priority=priority
+        )
+        if response is None:
+            return None
+        if response.status_code != 200:
+            print(f"Failed to fetch tweets: HTTP {response.status_code}")
+            return None
+        data = response.json()
+        tweets.extend(data.get("data", []))
+        for item in data.get("includes", {}).get("media", []):
+            media[item["media_key"]] = item
+        next_token = data.get("meta", {}).get("next_token")
+        if not next_token or len(tweets) >= max_tweets:
+            return tweets[:max_tweets], media, bool(next_token)
+        params["pagination_token"] = next_token
+
+
+def x_media_url(media):
+    """Download URL of an X media item (the best video variant), or None"""
+    if media["type"] == "photo":
+        return media.get("url")
+    if media["type"] in ["video", "animated_gif"]:
+        variants = media.get("variants", [])
+        if variants:
+            best_variant = max(
+                variants, key=lambda x: x.get("bitrate", 0), default=None
+            )
+            return best_variant.get("url") if best_variant else None
     return None
 
 
-def fetch_x_posts(username):
+def oldest_first(posts):
+    """Sort fetched posts by their ISO "timestamp" so they are sent in posting order"""
+    return sorted(posts, key=lambda post: post.get("timestamp") or "")
+
+
+def fetch_x_posts(
+    username, priority=twitter_budget.MANUAL, backfill=0, raise_errors=False
+):
+    """
+    Fetch the new posts of an X account, oldest first. Raises
+    twitter_budget.RateLimited if the API budget for priority is used up.
+
+    Only posts newer than the account's high-water mark (the newest post ID
+    fetched so far) are requested, with since_id. With backfill, up to
+    backfill posts (at most X_BACKFILL_LIMIT) older than the high-water mark
+    are paged through instead, so posts that were never seen are picked up.
+    A backfill leaves the high-water mark alone: posts newer than it are
+    left for the next regular fetch, which sends them.
+
+    Errors are printed and give an empty list, or with raise_errors are
+    raised (as FetchFailed if nothing else was raised) so auto fetch can
+    back off.
+    """
     try:
-        sent_posts = utils.load_sent_posts()
         new_posts = []
+        seen_ids = []
+        media_mappings = []
         clean_username = username.replace("@", "")
         print(f"Fetching X posts for: {clean_username}")
 
-        utils.register_account("twitter", clean_username)
-
         base_twitter_dir = os.path.join(MEDIA_DIR, "twitter")
         user_media_dir = os.path.join(base_twitter_dir, clean_username)
-        os.makedirs(user_media_dir, exist_ok=True)
+        utils.make_account_dir("twitter", clean_username, user_media_dir)
 
         headers = {
             "Authorization": f"Bearer {TWITTER_BEARER_TOKEN}",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
         }
 
-        user_id = get_twitter_user_id(clean_username, headers)
+        user_id = get_twitter_user_id(clean_username, headers, priority=priority)
         if not user_id:
-            print(f"Skipping X posts fetch for {clean_username} due to user ID failure")
-            return []
+            raise FetchFailed(
+                f"Could not get the user ID of X account {clean_username}"
+            )
 
-        tweets_url = f"https://api.twitter.com/2/users/{user_id}/tweets"
+        since_key = f"twitter_since_id:{clean_username.lower()}"
+        since_id = utils.get_store().get_meta(since_key)
         params = {
-            "max_results": 10,
             "expansions": "attachments.media_keys",
             "tweet.fields": "id,text,created_at",
             "media.fields": "media_key,type,url,variants",
         }
-        for attempt in range(3):
-            try:
-                tweets_response = requests.get(
-                    tweets_url, headers=headers, params=params, timeout=10
-                )
-                if tweets_response.status_code == 200:
-                    break
-                elif tweets_response.status_code == 429:
-                    reset_time = int(
-                        tweets_response.headers.get(
-                            "x-rate-limit-reset", time.time() + 900
-                        )
-                    )
-                    wait_time = max(reset_time - time.time(), 1)
-                    reset_datetime = time.ctime(reset_time)
-                    print(
-                        f"Rate limit exceeded for tweets. Waiting {wait_time:.0f} seconds until {reset_datetime}"
-                    )
-                    if CHAT_ID:
-                        bot.send_message(
-                            CHAT_ID,
-                            f"Twitter API rate limit reached for @{clean_username}'s tweets. Waiting {wait_time:.0f} seconds until {reset_datetime}.",
-                        )
-                    time.sleep(wait_time)
-                else:
-                    print(f"Failed to fetch tweets: HTTP {tweets_response.status_code}")
-                    return []
-            except requests.exceptions.RequestException as e:
-                print(f"Attempt {attempt+1}: Error fetching tweets: {e}")
-                time.sleep(2**attempt)
+        if backfill:
+            if since_id:
+                params["until_id"] = since_id
+            max_tweets = min(backfill, X_BACKFILL_LIMIT)
+        elif since_id:
+            params["since_id"] = since_id
+            max_tweets = X_MAX_NEW_POSTS
         else:
+            max_tweets = X_FIRST_FETCH
+
+        timeline = fetch_x_timeline(user_id, headers, params, max_tweets, priority)
+        if timeline is None:
             print(f"Failed to fetch tweets for {clean_username} after retries")
             if CHAT_ID:
                 bot.send_message(
                     CHAT_ID,
-                    f"Failed to fetch tweets for @{clean_username} after retries due to rate limits or errors.",
+                    f"Failed to fetch tweets for @{clean_username} due to network or API errors.",
                 )
-            return []
+            raise FetchFailed(f"Could not fetch the tweets of {clean_username}")
+        tweets, media_dict, truncated = timeline
+        if truncated and since_id and not backfill:
+            print(
+                f"More than {max_tweets} new posts from {clean_username}; "
+                "older ones are skipped, use a backfill to get them"
+            )
 
-        tweets_data = tweets_response.json()
+        newest_id = since_id
+        for tweet in tweets:
+            if newest_id is None or int(tweet["id"]) > int(newest_id):
+                newest_id = tweet["id"]
 
-        media_dict = {
-            m["media_key"]: m for m in tweets_data.get("includes", {}).get("media", [])
-        }
-        for tweet in tweets_data.get("data", []):
+        # Queue every media download of every new tweet first, then collect
+        # the results tweet by tweet so album order is preserved
+        pending_tweets = []
+        for tweet in tweets:
             tweet_id = tweet["id"]
-            if tweet_id not in sent_posts["x_posts"]:
-                media_paths = []
-                media_types = []
-
-                tweet_dir = os.path.join(user_media_dir, tweet_id)
-                os.makedirs(tweet_dir, exist_ok=True)
-
-                if "attachments" in tweet and "media_keys" in tweet["attachments"]:
-                    for media_key in tweet["attachments"]["media_keys"]:
-                        media = media_dict.get(media_key)
-                        if media:
-                            mtype = media["type"]
-                            murl = None
-
-                            if mtype == "photo":
-                                murl = media.get("url")
-                            elif mtype in ["video", "animated_gif"]:
-                                variants = media.get("variants", [])
-                                if variants:
-                                    best_variant = max(
-                                        variants,
-                                        key=lambda x: x.get("bitrate", 0),
-                                        default=None,
-                                    )
-                                    murl = (
-                                        best_variant.get("url")
-                                        if best_variant
-                                        else None
-                                    )
-
-                            if murl:
-                                ext = ".jpg" if mtype == "photo" else ".mp4"
-                                media_filename = utils.generate_media_filename(
-                                    "x", tweet_id, ext
-                                )
-                                media_path = os.path.join(tweet_dir, media_filename)
-
-                                if not os.path.exists(media_path):
-                                    if download_media(murl, media_path):
-                                        media_paths.append(media_path)
-                                        media_types.append(mtype)
-                                    else:
-                                        print(
-                                            f"Skipping media {murl} due to download failure"
-                                        )
-                                else:
-                                    media_paths.append(media_path)
-                                    media_types.append(mtype)
-                            else:
-                                print(
-                                    f"No valid URL for media_key {media_key}, type {mtype}"
-                                )
-
-                new_post = {
-                    "id": tweet_id,
-                    "content": f"New X post from @{clean_username}:\n\n{tweet['text']}",
-                    "url": f"https://twitter.com/{clean_username}/status/{tweet_id}",
-                }
-                if media_paths:
-                    new_post["media_paths"] = media_paths
-                    new_post["media_types"] = media_types
-
-                    utils.save_media_mapping(
-                        f"twitter_{clean_username}", tweet_id, media_paths
-                    )
-                    print(f"Added {len(media_paths)} media files to tweet {tweet_id}")
+            if utils.is_post_seen("x_posts", tweet_id):
+                continue
+
+            downloads = []
+            tweet_dir = os.path.join(user_media_dir, tweet_id)
+            os.makedirs(tweet_dir, exist_ok=True)
+
+            if "attachments" in tweet and "media_keys" in tweet["attachments"]:
+                for index, media_key in enumerate(tweet["attachments"]["media_keys"]):
+                    media = media_dict.get(media_key)
+                    if media:
+                        mtype = media["type"]
+                        murl = x_media_url(media)
+
+                        if murl:
+                            ext = ".jpg" if mtype == "photo" else ".mp4"
+                            media_filename = utils.generate_media_filename(
+                                "x", tweet_id, ext, index
+                            )
+                            media_path = os.path.join(tweet_dir, media_filename)
+                            future = download_pool.submit(murl, media_path)
+                            downloads.append((future, murl, media_path, mtype))
+                        else:
+                            print(
+                                f"No valid URL for media_key {media_key}, type {mtype}"
+                            )
+            pending_tweets.append((tweet, downloads))
+
+        for tweet, downloads in pending_tweets:
+            tweet_id = tweet["id"]
+            media_paths = []
+            media_types = []
+            for future, murl, media_path, mtype in downloads:
+                if future.result():
+                    media_paths.append(media_path)
+                    media_types.append(mtype)
                 else:
-                    new_post["media_note"] = (
-                        "Media unavailable due to download issues or missing URL"
-                    )
+                    print(f"Skipping media {murl} due to download failure")
 
-                new_posts.append(new_post)
-                sent_posts["x_posts"].append(tweet_id)
-                print(f"Added tweet ID {tweet_id}")
+            new_post = {
+                "id": tweet_id,
+                "content": f"New X post from @{clean_username}:\n\n{tweet['text']}",
+                "url": f"https://twitter.com/{clean_username}/status/{tweet_id}",
+                "timestamp": tweet.get("created_at", ""),
+            }
+            if media_paths:
+                new_post["media_paths"] = media_paths
+                new_post["media_types"] = media_types
+
+                media_mappings.append(
+                    (f"twitter_{clean_username}", tweet_id, media_paths)
+                )
+                print(f"Added {len(media_paths)} media files to tweet {tweet_id}")
+            else:
+                new_post["media_note"] = (
+                    "Media unavailable due to download issues or missing URL"
+                )
 
-        utils.save_sent_posts(sent_posts)
-        return new_posts
+            new_posts.append(new_post)
+            seen_ids.append(tweet_id)
+            print(f"Added tweet ID {tweet_id}")
+
+        # Hash and hardlink the files before the state batch, not inside it
+        for mapping in media_mappings:
+            utils.dedup_media(mapping[2])
+        with utils.state_transaction():
+            for mapping in media_mappings:
+                utils.save_media_mapping(*mapping, dedup=False)
+            utils.mark_posts_seen("x_posts", seen_ids)
+            if not backfill and newest_id and newest_id != since_id:
+                utils.get_store().set_meta(since_key, newest_id)
+        return oldest_first(new_posts)
+    except twitter_budget.RateLimited:
+        raise
+    except FetchFailed as e:
+        print(e)
+        if raise_errors:
+            raise
+        return []
     except Exception as e:
         print(f"Error fetching X posts: {e}")
         traceback.print_exc()
+        if raise_errors:
+            raise
         return []
 
 
+def fetch_x_post(post_id, username=None, priority=twitter_budget.MANUAL):
+    """
+    Fetch one X post and its media by ID, for a link someone sent. Unlike
+    fetch_x_posts this doesn't mark the post seen or move the account's
+    high-water mark, so auto fetch still sends it if it's new. Returns the
+    post, or None if it can't be fetched.
+    """
+    headers = {
+        "Authorization": f"Bearer {TWITTER_BEARER_TOKEN}",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    }
+    params = {
+        "expansions": "attachments.media_keys,author_id",
+        "tweet.fields": "id,text,created_at",
+        "media.fields": "media_key,type,url,variants",
+        "user.fields": "username",
+    }
+    response = twitter_get(
+        "tweets",
+        f"https://api.twitter.com/2/tweets/{post_id}",
+        headers,
+        params=params,
+        priority=priority,
+    )
+    if response is None or response.status_code != 200:
+        status = response.status_code if response is not None else "network error"
+        print(f"Failed to fetch X post {post_id}: {status}")
+        return None
+    data = response.json()
+    tweet = data.get("data")
+    if not tweet:
+        print(f"X post {post_id} not found: {data.get('errors')}")
+        return None
+    includes = data.get("includes", {})
+    media_dict = {item["media_key"]: item for item in includes.get("media", [])}
+    authors = includes.get("users", [])
+    if authors:
+        username = authors[0]["username"]
+    clean_username = (username or "unknown").replace("@", "")
+
+    tweet_dir = os.path.join(MEDIA_DIR, "twitter", clean_username, post_id)
+    os.makedirs(tweet_dir, exist_ok=True)
+    downloads = []
+    media_keys = tweet.get("attachments", {}).get("media_keys", [])
+    for index, media_key in enumerate(media_keys):
+        media = media_dict.get(media_key)
+        murl = x_media_url(media) if media else None
+        if not murl:
+            print(f"No valid URL for media_key {media_key}")
+            continue
+        ext = ".jpg" if media["type"] == "photo" else ".mp4"
+        media_path = os.path.join(
+            tweet_dir, utils.generate_media_filename("x", post_id, ext, index)
+        )
+        future = download_pool.submit(murl, media_path)
+        downloads.append((future, media_path, media["type"]))
+
+    post = {
+        "id": post_id,
+        "username": clean_username,
+        "content": tweet["text"],
+        "url": f"https://twitter.com/{clean_username}/status/{post_id}",
+        "timestamp": tweet.get("created_at", ""),
+    }
+    media_paths = []
+    media_types = []
+    for future, media_path, mtype in downloads:
+        if future.result():
+            media_paths.append(media_path)
+            media_types.append(mtype)
+    if media_paths:
+        post["media_paths"] = media_paths
+        post["media_types"] = media_types
+        utils.save_media_mapping(f"twitter_{clean_username}", post_id, media_paths)
+    return post
+
+
 def get_instagram_posts_safely(profile, max_count=500):
+    import instaloader
+    from instaloader.exceptions import QueryReturnedBadRequestException
+
     posts = []
 
     try:
@@ -421,7 +567,7 @@ def get_instagram_posts_safely(profile, max_count=500):
             }
 
             url = f"https://www.instagram.com/{username}/"
-            response = requests.get(url, headers=headers)
+            response = http_client.get(url, headers=headers)
 
             if response.status_code == 200:
                 shared_data_match = re.search(
@@ -495,27 +641,34 @@ def get_instagram_posts_safely(profile, max_count=500):
     return posts[:max_count]
 
 
-def fetch_instagram_posts(username):
-    if not INSTAGRAM_AVAILABLE:
+def fetch_instagram_posts(username, raise_errors=False):
+    """
+    Fetch the new posts of an Instagram account, oldest first. Errors are
+    printed and give an empty list, or with raise_errors are raised.
+    """
+    import instaloader
+
+    L = get_instagram_loader()
+    if L is None:
         print("INSTAGRAM_AVAILABLE is False, skipping Instagram posts.")
+        if raise_errors:
+            raise FetchFailed("Instagram is unavailable, the login failed")
         return []
     try:
-        sent_posts = utils.load_sent_posts()
         new_posts = []
+        seen_ids = []
+        media_mappings = []
         print(f"Fetching Instagram posts for: {username}")
 
-        utils.register_account("instagram", username)
-
         base_posts_dir = os.path.join(MEDIA_DIR, "instagram", "posts")
         user_media_dir = os.path.join(base_posts_dir, username)
-        os.makedirs(user_media_dir, exist_ok=True)
+        utils.make_account_dir("instagram", username, user_media_dir)
 
         try:
             print(f"Attempting to fetch profile for {username}")
             profile = instaloader.Profile.from_username(L.context, username)
         except Exception as e:
-            print(f"Error accessing Instagram profile '{username}': {e}")
-            return []
+            raise FetchFailed(f"Error accessing Instagram profile '{username}': {e}")
 
         print(
             f"Found Instagram profile {profile.username} with {profile.mediacount} posts"
@@ -524,55 +677,76 @@ def fetch_instagram_posts(username):
         posts = get_instagram_posts_safely(profile, 500)
 
         if not posts:
-            print(f"Could not retrieve any posts for {username}")
+            if profile.mediacount:
+                raise FetchFailed(f"Could not retrieve any posts for {username}")
             return []
 
+        # Queue the downloads of every new post first, then collect them in order
+        pending_posts = []
         for post in posts:
-            if str(post.shortcode) not in sent_posts["instagram_posts"]:
-                caption = post.caption if post.caption else "No caption"
+            if utils.is_post_seen("instagram_posts", post.shortcode):
+                continue
 
-                is_video = post.is_video
-                media_url = post.video_url if is_video else post.url
+            is_video = post.is_video
+            media_url = post.video_url if is_video else post.url
 
-                post_dir = os.path.join(user_media_dir, str(post.shortcode))
-                os.makedirs(post_dir, exist_ok=True)
+            post_dir = os.path.join(user_media_dir, str(post.shortcode))
+            os.makedirs(post_dir, exist_ok=True)
 
-                ext = ".mp4" if is_video else ".jpg"
-                media_filename = utils.generate_media_filename(
-                    "instagram", post.shortcode, ext
-                )
-                media_path = os.path.join(post_dir, media_filename)
+            ext = ".mp4" if is_video else ".jpg"
+            media_filename = utils.generate_media_filename(
+                "instagram", post.shortcode, ext
+            )
+            media_path = os.path.join(post_dir, media_filename)
+            future = download_pool.submit(media_url, media_path)
+            pending_posts.append((post, future, media_path))
 
-                if not os.path.exists(media_path):
-                    success = download_media(media_url, media_path)
-                else:
-                    success = True
-
-                new_post = {
-                    "id": post.shortcode,
-                    "content": f"New Instagram post from {username}:\n\n{caption}",
-                    "url": f"https://www.instagram.com/p/{post.shortcode}/",
-                }
-                if success and os.path.exists(media_path):
-                    new_post["media_paths"] = [media_path]
-                    new_post["media_types"] = ["video" if is_video else "photo"]
-
-                    utils.save_media_mapping(
-                        f"instagram_post_{username}", post.shortcode, [media_path]
-                    )
-                    print(f"Added media to Instagram post {post.shortcode}")
-                else:
-                    new_post["media_note"] = "Media unavailable due to download issues"
+        for post, future, media_path in pending_posts:
+            caption = post.caption if post.caption else "No caption"
+            is_video = post.is_video
+            success = future.result()
+            # Posts scraped as a fallback only carry .date
+            posted = getattr(post, "date_utc", None) or getattr(post, "date", None)
 
-                new_posts.append(new_post)
-                sent_posts["instagram_posts"].append(str(post.shortcode))
-                print(f"Added Instagram post ID {post.shortcode}")
+            new_post = {
+                "id": post.shortcode,
+                "content": f"New Instagram post from {username}:\n\n{caption}",
+                "url": f"https://www.instagram.com/p/{post.shortcode}/",
+                "timestamp": posted.isoformat() if posted else "",
+            }
+            if success and os.path.exists(media_path):
+                new_post["media_paths"] = [media_path]
+                new_post["media_types"] = ["video" if is_video else "photo"]
 
-        utils.save_sent_posts(sent_posts)
-        return new_posts
+                media_mappings.append(
+                    (f"instagram_post_{username}", post.shortcode, [media_path])
+                )
+                print(f"Added media to Instagram post {post.shortcode}")
+            else:
+                new_post["media_note"] = "Media unavailable due to download issues"
+
+            new_posts.append(new_post)
+            seen_ids.append(str(post.shortcode))
+            print(f"Added Instagram post ID {post.shortcode}")
+
+        # Hash and hardlink the files before the state batch, not inside it
+        for mapping in media_mappings:
+            utils.dedup_media(mapping[2])
+        with utils.state_transaction():
+            for mapping in media_mappings:
+                utils.save_media_mapping(*mapping, dedup=False)
+            utils.mark_posts_seen("instagram_posts", seen_ids)
+        return oldest_first(new_posts)
+    except FetchFailed as e:
+        print(e)
+        if raise_errors:
+            raise
+        return []
     except Exception as e:
         print(f"Error fetching Instagram posts: {e}")
         traceback.print_exc()
+        if raise_errors:
+            raise
         return []
 
 
@@ -586,7 +760,10 @@ def fetch_instagram_post_by_shortcode(shortcode):
     Returns:
         Dictionary with post information or None if not found
     """
-    if not INSTAGRAM_AVAILABLE:
+    import instaloader
+
+    L = get_instagram_loader()
+    if L is None:
         print("INSTAGRAM_AVAILABLE is False, skipping Instagram post fetch.")
         return None
 
@@ -622,7 +799,7 @@ def fetch_instagram_post_by_shortcode(shortcode):
             media_path = os.path.join(post_dir, media_filename)
 
             if not os.path.exists(media_path):
-                success = download_media(media_url, media_path)
+                success = utils.download_media(media_url, media_path)
             else:
                 success = True
 
@@ -647,11 +824,8 @@ def fetch_instagram_post_by_shortcode(shortcode):
                 post_data["media_url"] = media_url
                 print(f"Could not download media, using direct URL")
 
-            # Track this post in sent_posts
-            sent_posts = utils.load_sent_posts()
-            if str(post.shortcode) not in sent_posts["instagram_posts"]:
-                sent_posts["instagram_posts"].append(str(post.shortcode))
-                utils.save_sent_posts(sent_posts)
+            # Track this post as sent
+            utils.mark_posts_seen("instagram_posts", [str(post.shortcode)])
 
             return post_data
 
@@ -666,7 +840,7 @@ def fetch_instagram_post_by_shortcode(shortcode):
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             }
-            response = requests.get(url, headers=headers, timeout=10)
+            response = http_client.get(url, headers=headers, timeout=10)
 
             if response.status_code == 200:
                 # Try to find JSON data in the page
@@ -719,89 +893,120 @@ def fetch_instagram_post_by_shortcode(shortcode):
         return None
 
 
-def fetch_instagram_stories(username, skip_tracking=False):
+def fetch_instagram_stories(username, skip_tracking=False, raise_errors=False):
     """
     Fetch Instagram stories for a specific username.
     When skip_tracking=True, it won't save stories to the JSON tracking file.
+    With raise_errors, errors are raised instead of giving an empty list.
     """
-    if not INSTAGRAM_AVAILABLE:
+    import instaloader
+
+    L = get_instagram_loader()
+    if L is None:
         print("INSTAGRAM_AVAILABLE is False, skipping Instagram stories.")
+        if raise_errors:
+            raise FetchFailed("Instagram is unavailable, the login failed")
         return []
     try:
-        sent_posts = utils.load_sent_posts()
         new_stories = []
+        seen_ids = []
+        media_mappings = []
         print(f"Fetching Instagram stories for: {username}")
 
-        utils.register_account("instagram", username)
-
         base_stories_dir = os.path.join(MEDIA_DIR, "instagram", "stories")
         user_media_dir = os.path.join(base_stories_dir, username)
-        os.makedirs(user_media_dir, exist_ok=True)
+        utils.make_account_dir("instagram", username, user_media_dir)
 
         try:
             profile = instaloader.Profile.from_username(L.context, username)
         except Exception as e:
-            print(f"Error accessing Instagram profile '{username}': {e}")
-            return []
+            raise FetchFailed(f"Error accessing Instagram profile '{username}': {e}")
 
+        pending_items = []
         try:
             stories = L.get_stories([profile.userid])
             for story in stories:
                 for item in story.get_items():
-                    if str(item.mediaid) not in sent_posts["instagram_stories"]:
-                        is_video = item.is_video
-                        story_url = item.video_url if is_video else item.url
+                    if utils.is_post_seen("instagram_stories", item.mediaid):
+                        continue
+                    is_video = item.is_video
+                    story_url = item.video_url if is_video else item.url
 
-                        story_dir = os.path.join(user_media_dir, str(item.mediaid))
-                        os.makedirs(story_dir, exist_ok=True)
+                    story_dir = os.path.join(user_media_dir, str(item.mediaid))
+                    os.makedirs(story_dir, exist_ok=True)
 
-                        ext = ".mp4" if is_video else ".jpg"
-                        media_filename = utils.generate_media_filename(
-                            "instagram_story", item.mediaid, ext
+                    ext = ".mp4" if is_video else ".jpg"
+                    media_filename = utils.generate_media_filename(
+                        "instagram_story", item.mediaid, ext
+                    )
+                    media_path = os.path.join(story_dir, media_filename)
+                    future = download_pool.submit(story_url, media_path)
+                    pending_items.append(
+                        (
+                            item.mediaid,
+                            is_video,
+                            story_url,
+                            future,
+                            media_path,
+                            item.date_utc.isoformat(),
                         )
-                        media_path = os.path.join(story_dir, media_filename)
-
-                        if not os.path.exists(media_path):
-                            success = download_media(story_url, media_path)
-                        else:
-                            success = True
-
-                        new_story = {
-                            "id": item.mediaid,
-                            "content": f"New Instagram story from {username}!",
-                            "url": story_url,
-                        }
-                        if success and os.path.exists(media_path):
-                            new_story["media_paths"] = [media_path]
-                            new_story["media_types"] = [
-                                "video" if is_video else "photo"
-                            ]
-
-                            utils.save_media_mapping(
-                                f"instagram_story_{username}",
-                                item.mediaid,
-                                [media_path],
-                            )
-                            print(f"Added media to Instagram story {item.mediaid}")
-                        else:
-                            new_story["media_note"] = (
-                                "Media unavailable due to download issues"
-                            )
-
-                        new_stories.append(new_story)
-                        sent_posts["instagram_stories"].append(str(item.mediaid))
-                        print(f"Added Instagram story ID {item.mediaid}")
+                    )
         except instaloader.exceptions.LoginRequiredException:
             print("Instagram login required to fetch stories")
+            if raise_errors:
+                raise FetchFailed("Instagram login required to fetch stories")
         except Exception as e:
             print(f"Error processing stories: {e}")
+            if raise_errors:
+                raise FetchFailed(f"Error processing stories: {e}")
+
+        for (
+            mediaid,
+            is_video,
+            story_url,
+            future,
+            media_path,
+            timestamp,
+        ) in pending_items:
+            success = future.result()
+            new_story = {
+                "id": mediaid,
+                "content": f"New Instagram story from {username}!",
+                "url": story_url,
+                "timestamp": timestamp,
+            }
+            if success and os.path.exists(media_path):
+                new_story["media_paths"] = [media_path]
+                new_story["media_types"] = ["video" if is_video else "photo"]
 
-        if skip_tracking:
-            return new_stories
-
-        utils.save_sent_posts(sent_posts)
-        return new_stories
+                media_mappings.append(
+                    (f"instagram_story_{username}", mediaid, [media_path])
+                )
+                print(f"Added media to Instagram story {mediaid}")
+            else:
+                new_story["media_note"] = "Media unavailable due to download issues"
+
+            new_stories.append(new_story)
+            seen_ids.append(str(mediaid))
+            print(f"Added Instagram story ID {mediaid}")
+
+        # Hash and hardlink the files before the state batch, not inside it
+        for mapping in media_mappings:
+            utils.dedup_media(mapping[2])
+        with utils.state_transaction():
+            for mapping in media_mappings:
+                utils.save_media_mapping(*mapping, dedup=False)
+            if not skip_tracking:
+                utils.mark_posts_seen("instagram_stories", seen_ids)
+        return oldest_first(new_stories)
+    except FetchFailed as e:
+        print(e)
+        if raise_errors:
+            raise
+        return []
     except Exception as e:
         print(f"Error fetching Instagram stories: {e}")
         traceback.print_exc()
+        if raise_errors:
+            raise
         return []
@@ -0,0 +1,74 @@
+import os
+import threading
+
+from blob_store import file_sha256
+
+
+def message_file_id(message, media_type):
+    """Pick the reusable file_id out of a message Telegram returned for a send"""
+    if media_type == "photo" and getattr(message, "photo", None):
+        return message.photo[-1].file_id  # largest size
+    # Telegram may turn a video into an animation or document
+    for attr in ("video", "animation", "document"):
+        obj = getattr(message, attr, None)
+        if obj is not None:
+            return obj.file_id
+    return None
+
+
+class FileIdCache:
+    """
+    Telegram file_ids of uploaded media, keyed by local path and by content hash.
+
+    The path key (path plus size) answers repeat sends of the same file
+    without reading it. The SHA-256 key catches the same bytes saved under
+    another name, e.g. a re-fetched post. A file_id is only valid for the
+    media type it was uploaded as, so that is part of the key as well.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._digests = {}  # path key -> sha256, so put() doesn't hash twice
+
+    def _path_key(self, path):
+        return f"path:{os.path.abspath(path)}:{os.path.getsize(path)}"
+
+    def _hash_key(self, path, path_key):
+        with self._lock:
+            digest = self._digests.get(path_key)
+        if digest is None:
+            digest = file_sha256(path)
+            with self._lock:
+                self._digests[path_key] = digest
+        return f"sha256:{digest}"
+
+    def get(self, path, media_type):
+        """Cached file_id for a local file, or None if it has to be uploaded"""
+        try:
+            path_key = self._path_key(path)
+            file_id = self.store.get_file_id(path_key, media_type)
+            if file_id:
+                return file_id
+            file_id = self.store.get_file_id(self._hash_key(path, path_key), media_type)
+        except OSError:
+            return None
+        if file_id:
+            self.store.set_file_ids([(path_key, media_type, file_id)])
+        return file_id
+
+    def put(self, path, media_type, file_id):
+        try:
+            path_key = self._path_key(path)
+            hash_key = self._hash_key(path, path_key)
+        except OSError:
+            return
+        self.store.set_file_ids(
+            [(path_key, media_type, file_id), (hash_key, media_type, file_id)]
+        )
+        with self._lock:
+            self._digests.pop(path_key, None)
+
+    def forget(self, file_id):
+        """Drop a file_id Telegram no longer accepts"""
+        self.store.remove_file_id(file_id)
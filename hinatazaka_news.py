@@ -1,14 +1,15 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 
+import http_client
+
 
 def fetch_monthly_news(year, month):
     """Fetch news list for the specified year and month from Hinatazaka46 website."""
     base_url = "https://www.hinatazaka46.com/s/official/news/list?ima=0000&dy="
     y_m = f"{year}{month:02d}"
     url = base_url + y_m
-    resp = requests.get(url)
+    resp = http_client.get(url)
     if resp.status_code != 200:
         return []
 
@@ -51,7 +52,7 @@ def fetch_monthly_news(year, month):
 
 def fetch_news_detail(url):
     """Fetch detail HTML from a Hinatazaka46 news article."""
-    resp = requests.get(url)
+    resp = http_client.get(url)
     if resp.status_code != 200:
         return "Failed to fetch details."
 
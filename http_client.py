@@ -0,0 +1,66 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of distinct hosts to keep a connection pool for, and keep-alive
+# connections per host (pbs.twimg.com, video.twimg.com, Instagram CDN, ...)
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "20"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+DEFAULT_TIMEOUT = 10
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+_lock = threading.Lock()
+_adapter = None
+_session = None
+
+
+def _get_adapter():
+    global _adapter
+    if _adapter is None:
+        _adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE,
+            pool_block=False,
+        )
+    return _adapter
+
+
+def new_session(headers=None):
+    """
+    Create a session with its own cookies and headers that still reuses the
+    shared per-host connection pools.
+    """
+    with _lock:
+        adapter = _get_adapter()
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def get_session():
+    """Return the process-wide session used for plain requests"""
+    global _session
+    if _session is None:
+        session = new_session()
+        with _lock:
+            if _session is None:
+                _session = session
+    return _session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return get_session().head(url, **kwargs)
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+import traceback
+
+# Long-running commands (downloads, fetches) that may run at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Minimum seconds between two edits of a job's progress message
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "3"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job once /cancel was used on it. Derives from
+    BaseException so the broad `except Exception` retry loops in the
+    download code don't swallow it.
+    """
+
+
+class Job:
+    """Handle passed to a job function for reporting progress and cancellation"""
+
+    def __init__(self, manager, job_id, kind, chat_id, message_id):
+        self.manager = manager
+        self.id = job_id
+        self.kind = kind
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.cancel_requested = threading.Event()
+        self._last_edit = 0.0
+        self._last_text = None
+
+    def check_cancelled(self):
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def progress(self, text, force=False):
+        """
+        Show text in the job's progress message. Edits are throttled to one
+        per JOB_PROGRESS_INTERVAL unless force is set. Also a cancellation
+        point, so long loops only need to report progress.
+        """
+        self.check_cancelled()
+        now = time.monotonic()
+        if not force and now - self._last_edit < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_edit = now
+        self.manager.show(self, text)
+
+
+class JobManager:
+    """
+    Persistent queue of background jobs run by a fixed pool of workers.
+
+    submit() records the job in the state store, posts a progress message
+    and returns the job ID right away. Handlers are registered per kind and
+    called as handler(job, **args) on a worker thread. Jobs that were queued
+    or running when the bot stopped are run again on the next start.
+    Cancelling a queued job drops it; a running job is stopped at its next
+    progress() or check_cancelled() call.
+    """
+
+    def __init__(self, store, bot, handlers, workers=JOB_WORKERS):
+        self.store = store
+        self.bot = bot
+        self.handlers = handlers
+        self.workers = workers
+        self._running = {}  # job_id -> Job
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+
+    def start(self):
+        requeued = self.store.requeue_running_jobs()
+        if requeued:
+            print(f"Re-queued {requeued} jobs interrupted by the last shutdown")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, chat_id, description, **args):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.add_job(kind, chat_id, description, args)
+        try:
+            message = self.bot.send_message(
+                chat_id, f"Job #{job_id} queued: {description}"
+            )
+            self.store.set_job_message(job_id, message.message_id)
+        except Exception as e:
+            print(f"Could not post progress message for job {job_id}: {e}")
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """Returns the job's status after the request, or None if unknown"""
+        with self._lock:
+            job = self._running.get(job_id)
+            if job is not None:
+                job.cancel_requested.set()
+                return "cancelling"
+            row = self.store.get_job(job_id)
+            if row is None:
+                return None
+            if row["status"] == "queued":
+                self.store.finish_job(job_id, "cancelled")
+                if row["message_id"]:
+                    self._edit(
+                        row["chat_id"],
+                        row["message_id"],
+                        f"Job #{job_id} cancelled: {row['description']}",
+                    )
+                return "cancelled"
+            return row["status"]
+
+    def list_jobs(self, limit=10):
+        return self.store.list_jobs(limit)
+
+    def show(self, job, text):
+        if job.message_id:
+            self._edit(job.chat_id, job.message_id, f"Job #{job.id}: {text}")
+
+    def _edit(self, chat_id, message_id, text):
+        try:
+            self.bot.edit_message_text(text, chat_id, message_id)
+        except Exception as e:
+            # "message is not modified" and deleted messages are harmless
+            if "not modified" not in str(e):
+                print(f"Could not update progress message: {e}")
+
+    def _claim(self):
+        with self._wakeup:
+            while True:
+                row = self.store.claim_next_job()
+                if row is not None:
+                    job = Job(
+                        self,
+                        row["id"],
+                        row["kind"],
+                        row["chat_id"],
+                        row["message_id"],
+                    )
+                    self._running[job.id] = job
+                    return job, row
+                self._wakeup.wait(30)
+
+    def _work(self):
+        while True:
+            job, row = self._claim()
+            status, text, error = "done", None, None
+            try:
+                job.progress(f"running: {row['description']}", force=True)
+                text = self.handlers[job.kind](job, **row["args"])
+            except JobCancelled:
+                status = "cancelled"
+            except Exception as e:
+                status, error = "failed", str(e)
+                print(f"Job {job.id} ({job.kind}) failed: {e}")
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._running.pop(job.id, None)
+                self.store.finish_job(job.id, status, error)
+
+            if status == "done":
+                summary = text or f"done: {row['description']}"
+            elif status == "cancelled":
+                summary = f"cancelled: {row['description']}"
+            else:
+                summary = f"failed: {row['description']}\n{error}"
+            self.show(job, summary)
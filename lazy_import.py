@@ -0,0 +1,28 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Lets bot.py refer to heavy modules (instaloader, yt_dlp, selenium,
+    bilibili_api behind them) by name without paying for their import
+    until a command actually needs them.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attr):
+        # import_module is a dict lookup once the module is loaded
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(importlib.import_module(self._name), attr, value)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def lazy(name):
+    return LazyModule(name)
@@ -0,0 +1,48 @@
+import telegram_api
+
+# Telegram limits: albums hold 2-10 photos/videos and photos may be up to
+# 10 MB; the upload limit depends on whether a local Bot API server is used
+MAX_ALBUM_SIZE = 10
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+UPLOAD_MAX_BYTES = telegram_api.UPLOAD_MAX_BYTES
+
+
+def split_evenly(items, max_size=MAX_ALBUM_SIZE):
+    """Split items into the fewest chunks of at most max_size, sized evenly (11 -> 6 + 5)"""
+    if not items:
+        return []
+    count = -(-len(items) // max_size)
+    base, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        size = base + (1 if i < extra else 0)
+        chunks.append(items[start : start + size])
+        start += size
+    return chunks
+
+
+def sends_alone(item):
+    """Documents can't share an album with photos, oversized uploads would sink it"""
+    if item["type"] == "document":
+        return True
+    return item["file_id"] is None and item["size"] > UPLOAD_MAX_BYTES
+
+
+def plan_batches(items):
+    """
+    Group media items (dicts with path, type, size and file_id) into sends,
+    keeping their order. Runs of album-able items become evenly sized
+    albums; every item that has to go alone gets a batch of its own.
+    """
+    batches = []
+    run = []
+    for item in items:
+        if sends_alone(item):
+            batches.extend(split_evenly(run))
+            run = []
+            batches.append([item])
+        else:
+            run.append(item)
+    batches.extend(split_evenly(run))
+    return batches
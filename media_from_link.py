@@ -7,18 +7,15 @@ import shutil
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import utils
-import bot
 import fetchers
-from telebot import TeleBot
 from dotenv import load_dotenv
 from instaloader.exceptions import (
     LoginRequiredException,
     QueryReturnedBadRequestException,
 )
 
-# Get bot instance for direct message sending
-BOT_TOKEN = utils.BOT_TOKEN
-tgbot = TeleBot(BOT_TOKEN)
+# Shared Telegram client for direct replies
+tgbot = utils.bot
 
 
 def extract_instagram_story_info(url):
@@ -52,12 +49,9 @@ def fetch_specific_instagram_story(username, story_id):
     """
     try:
         # First check if we already have this story saved locally
-        sent_posts = utils.load_sent_posts()
-
-        # Check if we have the story in our mapping
         story_key = f"instagram_story_{username}_{story_id}"
-        if story_key in sent_posts.get("media_mapping", {}):
-            media_paths = sent_posts["media_mapping"][story_key]
+        media_paths = utils.get_media_mapping(story_key)
+        if media_paths:
             # Verify files exist
             valid_paths = [p for p in media_paths if os.path.exists(p)]
             if valid_paths:
@@ -266,29 +260,28 @@ def fetch_specific_instagram_post(post_id):
     try:
         # We don't know the username in advance, so we need to search through posts
         # from various accounts that we monitor
-        sent_posts = utils.load_sent_posts()
         instagram_accounts = utils.get_accounts_by_platform("instagram_posts")
         if not instagram_accounts:
             instagram_accounts = utils.get_accounts_by_platform("instagram")
 
-        # Start with recent posts in sent_posts
-        for post_entry in sent_posts.get("instagram_posts", []):
-            if post_id in post_entry:
-                for account in instagram_accounts:
-                    key = f"instagram_post_{account}_{post_id}"
-                    if key in sent_posts.get("media_mapping", {}):
-                        # Found matching post in our history
-                        media_paths = sent_posts["media_mapping"][key]
-                        return {
-                            "post_id": post_id,
-                            "media_paths": media_paths,
-                            "media_types": [
-                                "photo" if not path.endswith(".mp4") else "video"
-                                for path in media_paths
-                            ],
-                            "content": f"Instagram post found in history",
-                            "url": f"https://www.instagram.com/p/{post_id}/",
-                        }
+        # Start with posts we have already sent
+        if utils.is_post_seen("instagram_posts", post_id):
+            for account in instagram_accounts:
+                media_paths = utils.get_media_mapping(
+                    f"instagram_post_{account}_{post_id}"
+                )
+                if media_paths:
+                    # Found matching post in our history
+                    return {
+                        "post_id": post_id,
+                        "media_paths": media_paths,
+                        "media_types": [
+                            "photo" if not path.endswith(".mp4") else "video"
+                            for path in media_paths
+                        ],
+                        "content": f"Instagram post found in history",
+                        "url": f"https://www.instagram.com/p/{post_id}/",
+                    }
 
         # Try to fetch from accounts we know about
         for account in instagram_accounts:
@@ -394,16 +387,17 @@ def cleanup_instagram_media(username, content_id, content_type, media_paths):
             if os.path.exists(path):
                 os.remove(path)
                 print(f"Deleted file: {path}")
+        utils.unindex_media(media_paths)
 
         # Remove directory if empty
         try:
             if content_type == "post":
                 content_dir = os.path.join(
-                    bot.INSTAGRAM_POSTS_DIR, username, content_id
+                    utils.INSTAGRAM_POSTS_DIR, username, content_id
                 )
             else:  # story
                 content_dir = os.path.join(
-                    bot.INSTAGRAM_STORIES_DIR, username, content_id
+                    utils.INSTAGRAM_STORIES_DIR, username, content_id
                 )
 
             if os.path.exists(content_dir) and not os.listdir(content_dir):
@@ -418,31 +412,14 @@ def cleanup_instagram_media(username, content_id, content_type, media_paths):
         except Exception as e:
             print(f"Error removing directories: {e}")
 
-        # Remove references from JSON
-        sent_posts = utils.load_sent_posts()
-        key_suffix = (
-            f"{'post' if content_type == 'post' else 'story'}_{username}_{content_id}"
-        )
-
-        # Remove from media mapping
-        if "media_mapping" in sent_posts:
-            keys_to_remove = [
-                k for k in sent_posts["media_mapping"] if k.endswith(key_suffix)
-            ]
-            for key in keys_to_remove:
-                sent_posts["media_mapping"].pop(key, None)
-
-        # Remove from post lists if needed
-        if content_type == "post" and "instagram_posts" in sent_posts:
-            sent_posts["instagram_posts"] = [
-                p for p in sent_posts["instagram_posts"] if content_id not in p
-            ]
-        elif content_type == "story" and "instagram_stories" in sent_posts:
-            sent_posts["instagram_stories"] = [
-                s for s in sent_posts["instagram_stories"] if content_id not in s
-            ]
-
-        utils.save_sent_posts(sent_posts)
+        # Remove references from the state store
+        if content_type == "post":
+            kind, key = "instagram_posts", f"instagram_post_{username}_{content_id}"
+        else:  # story
+            kind, key = "instagram_stories", f"instagram_story_{username}_{content_id}"
+        with utils.state_transaction():
+            utils.remove_media_mapping(key)
+            utils.unmark_posts_seen(kind, [content_id])
         print(f"Cleaned up references to {content_type} {content_id}")
 
     except Exception as e:
@@ -495,14 +472,12 @@ def fetch_specific_x_post(post_id, username=None):
     """
     try:
         # Check if we've already downloaded this post
-        sent_posts = utils.load_sent_posts()
         x_accounts = utils.get_accounts_by_platform("twitter")
 
         # First, try the specific username if provided
         if username:
-            key = f"twitter_{username}_{post_id}"
-            if key in sent_posts.get("media_mapping", {}):
-                media_paths = sent_posts["media_mapping"][key]
+            media_paths = utils.get_media_mapping(f"twitter_{username}_{post_id}")
+            if media_paths:
                 valid_paths = [p for p in media_paths if os.path.exists(p)]
                 if valid_paths:
                     return {
@@ -519,9 +494,8 @@ def fetch_specific_x_post(post_id, username=None):
 
         # Try all known accounts
         for account in x_accounts:
-            key = f"twitter_{account}_{post_id}"
-            if key in sent_posts.get("media_mapping", {}):
-                media_paths = sent_posts["media_mapping"][key]
+            media_paths = utils.get_media_mapping(f"twitter_{account}_{post_id}")
+            if media_paths:
                 valid_paths = [p for p in media_paths if os.path.exists(p)]
                 if valid_paths:
                     return {
@@ -536,41 +510,12 @@ def fetch_specific_x_post(post_id, username=None):
                         "url": f"https://twitter.com/{account}/status/{post_id}",
                     }
 
-        # Not found in our records, try to fetch it if username is provided
-        if username:
-            try:
-                # This will attempt to fetch recent posts from the user,
-                # which may include the one we're looking for
-                new_posts = fetchers.fetch_x_posts(username)
-
-                # Check if our post_id is now in the fetched posts
-                sent_posts = utils.load_sent_posts()
-                key = f"twitter_{username}_{post_id}"
-                if key in sent_posts.get("media_mapping", {}):
-                    media_paths = sent_posts["media_mapping"][key]
-                    valid_paths = [p for p in media_paths if os.path.exists(p)]
-                    if valid_paths:
-                        return {
-                            "id": post_id,
-                            "username": username,
-                            "media_paths": valid_paths,
-                            "media_types": [
-                                "photo" if not path.endswith(".mp4") else "video"
-                                for path in valid_paths
-                            ],
-                            "content": f"X post from @{username}",
-                            "url": f"https://twitter.com/{username}/status/{post_id}",
-                        }
-
-                # Alternative: search through the returned new posts
-                for post in new_posts:
-                    if post.get("id") == post_id:
-                        return post
-            except Exception as e:
-                print(f"Error fetching posts for {username}: {e}")
-
-        # Post not found
-        return None
+        # Not found in our records, fetch it by ID
+        try:
+            return fetchers.fetch_x_post(post_id, username)
+        except Exception as e:
+            print(f"Error fetching X post {post_id}: {e}")
+            return None
 
     except Exception as e:
         print(f"Error fetching specific X post: {e}")
@@ -645,10 +590,11 @@ def cleanup_x_media(username, post_id, media_paths):
             if os.path.exists(path):
                 os.remove(path)
                 print(f"Deleted file: {path}")
+        utils.unindex_media(media_paths)
 
         # Remove directory if empty
         try:
-            content_dir = os.path.join(bot.TWITTER_MEDIA_DIR, username, post_id)
+            content_dir = os.path.join(utils.TWITTER_MEDIA_DIR, username, post_id)
             if os.path.exists(content_dir) and not os.listdir(content_dir):
                 os.rmdir(content_dir)
                 print(f"Removed empty directory: {content_dir}")
@@ -661,13 +607,11 @@ def cleanup_x_media(username, post_id, media_paths):
         except Exception as e:
             print(f"Error removing directories: {e}")
 
-        # Remove from media mapping in JSON
-        sent_posts = utils.load_sent_posts()
+        # Remove from media mapping in the state store
         key = f"twitter_{username}_{post_id}"
 
-        if "media_mapping" in sent_posts and key in sent_posts["media_mapping"]:
-            sent_posts["media_mapping"].pop(key, None)
-            utils.save_sent_posts(sent_posts)
+        if utils.get_media_mapping(key):
+            utils.remove_media_mapping(key)
             print(f"Removed media mapping for {key}")
 
         # Note: We're keeping the post ID in x_posts list to avoid re-downloading via auto-fetch
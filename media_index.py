@@ -0,0 +1,106 @@
+import os
+
+# platform -> path of its directory below MEDIA_DIR; posts live in
+# <platform dir>/<account>/<post_id>/
+PLATFORM_DIRS = {
+    "twitter": ("twitter",),
+    "instagram_posts": ("instagram", "posts"),
+    "instagram_stories": ("instagram", "stories"),
+    "bilibili": ("bilibili",),
+}
+
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".mp4")
+
+
+class MediaIndex:
+    """
+    Persistent index from (platform, account, post_id) to media file paths.
+
+    Download code adds files as it saves them. rescan() brings the index in
+    line with the disk for changes made behind the bot's back; it only lists
+    post directories whose mtime differs from the one recorded last time.
+    """
+
+    def __init__(self, store, media_dir):
+        self.store = store
+        self.media_dir = media_dir
+
+    def classify(self, path):
+        """Return (platform, account, post_id) for a path inside MEDIA_DIR, or None"""
+        try:
+            rel = os.path.relpath(
+                os.path.abspath(path), os.path.abspath(self.media_dir)
+            )
+        except ValueError:
+            return None
+        parts = rel.replace("\\", "/").split("/")
+        for platform, prefix in PLATFORM_DIRS.items():
+            n = len(prefix)
+            if tuple(parts[:n]) == prefix and len(parts) == n + 3:
+                return platform, parts[n], parts[n + 1]
+        return None
+
+    def _row(self, path):
+        info = self.classify(path)
+        if info is None:
+            return None
+        platform, account, post_id = info
+        return (path, platform, account, post_id, os.path.dirname(path))
+
+    def add_files(self, paths):
+        rows = [r for r in (self._row(p) for p in paths) if r is not None]
+        if rows:
+            self.store.add_media_files(rows)
+
+    def remove_files(self, paths):
+        if paths:
+            self.store.remove_media_files(paths)
+
+    def find(self, platform, post_id, account=None):
+        """Indexed media paths for a post; stale entries are dropped on the way"""
+        paths = self.store.find_media_files(platform, post_id, account)
+        existing = [p for p in paths if os.path.exists(p)]
+        if len(existing) != len(paths):
+            self.remove_files([p for p in paths if p not in existing])
+        return existing
+
+    def rescan(self):
+        """Incrementally re-sync the index with MEDIA_DIR, returns dirs re-listed"""
+        known = self.store.get_media_dir_mtimes()
+        seen_dirs = set()
+        relisted = 0
+
+        for prefix in PLATFORM_DIRS.values():
+            platform_dir = os.path.join(self.media_dir, *prefix)
+            for account_entry in _subdirs(platform_dir):
+                for post_entry in _subdirs(account_entry.path):
+                    dir_path = post_entry.path
+                    seen_dirs.add(dir_path)
+                    try:
+                        mtime = post_entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    if known.get(dir_path) == mtime:
+                        continue
+                    rows = []
+                    for file_entry in os.scandir(dir_path):
+                        if file_entry.is_file() and file_entry.name.lower().endswith(
+                            MEDIA_EXTENSIONS
+                        ):
+                            row = self._row(file_entry.path)
+                            if row is not None:
+                                rows.append(row)
+                    self.store.replace_media_dir(dir_path, mtime, rows)
+                    relisted += 1
+
+        vanished = [d for d in known if d not in seen_dirs]
+        if vanished:
+            self.store.remove_media_dirs(vanished)
+        return relisted
+
+
+def _subdirs(path):
+    try:
+        return [e for e in os.scandir(path) if e.is_dir()]
+    except OSError:
+        return []
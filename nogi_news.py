@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import json
@@ -11,6 +10,8 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import http_client
+
 
 def fetch_monthly_news(year, month):
     """Fetch news list for the specified year and month from Nogizaka46 website."""
@@ -148,7 +149,7 @@ def fetch_news_from_api(year, month):
     }
 
     try:
-        session = requests.Session()
+        session = http_client.new_session()
 
         session.cookies.set("wovn_selected_lang", "ja", domain=".nogizaka46.com")
         session.cookies.set("language", "ja", domain=".nogizaka46.com")
@@ -274,7 +275,7 @@ def fetch_news_detail(url):
 
         # Fallback
         try:
-            session = requests.Session()
+            session = http_client.new_session()
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
                 "Accept-Language": "ja,ja_JP;q=0.9,en;q=0.8",
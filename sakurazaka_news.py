@@ -1,14 +1,15 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 
+import http_client
+
 
 def fetch_monthly_news(year, month):
     """Fetch news list for the specified year and month."""
     base_url = "https://sakurazaka46.com/s/s46/news/list?ima=0000&dy="
     y_m = f"{year}{month:02d}"
     url = base_url + y_m
-    resp = requests.get(url)
+    resp = http_client.get(url)
     if resp.status_code != 200:
         return []
     soup = BeautifulSoup(resp.text, "html.parser")
@@ -45,7 +46,7 @@ def fetch_monthly_news(year, month):
 
 def fetch_news_detail(url):
     """Fetch detail HTML from the col-c post section."""
-    resp = requests.get(url)
+    resp = http_client.get(url)
     if resp.status_code != 200:
         return "Failed to fetch details."
 
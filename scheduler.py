@@ -0,0 +1,300 @@
+import os
+import time
+import random
+import threading
+import traceback
+from collections import deque
+
+# Bounds for an account's adaptive polling interval, in seconds
+MIN_INTERVAL = int(os.getenv("AUTO_FETCH_MIN_INTERVAL", str(5 * 60)))
+MAX_INTERVAL = int(os.getenv("AUTO_FETCH_MAX_INTERVAL", str(6 * 60 * 60)))
+# Longest wait after repeated errors
+MAX_BACKOFF = int(os.getenv("AUTO_FETCH_MAX_BACKOFF", str(2 * 60 * 60)))
+# Each delay is randomly stretched or shrunk by up to this fraction
+JITTER = float(os.getenv("AUTO_FETCH_JITTER", "0.1"))
+# Accounts that are due at once (first start, or missed while the bot was
+# down) are spread over this many seconds instead of all polling together
+CATCHUP_WINDOW = int(os.getenv("AUTO_FETCH_CATCHUP_WINDOW", "300"))
+
+# Polls that may run at the same time per platform; Instagram defaults to
+# one at a time since every request goes through the one logged-in session
+PLATFORM_CONCURRENCY = {
+    "x": int(os.getenv("AUTO_FETCH_X_CONCURRENCY", "4")),
+    "instagram": int(os.getenv("AUTO_FETCH_INSTAGRAM_CONCURRENCY", "1")),
+    "instagram_stories": int(os.getenv("AUTO_FETCH_STORIES_CONCURRENCY", "1")),
+}
+
+# How the interval reacts to a poll: shrink when it found posts, grow when quiet
+BUSY_FACTOR = 0.5
+QUIET_FACTOR = 1.25
+
+
+def jittered(delay, jitter=JITTER):
+    return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+
+class AccountSchedule:
+    """Polling state of one account on one platform"""
+
+    def __init__(self, platform, username, interval):
+        self.platform = platform
+        self.username = username
+        self.interval = interval
+        self.next_run = 0.0
+        self.last_run = None
+        self.last_success = None
+        self.last_new = 0
+        self.failures = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=10)
+
+    def restore(self, row):
+        """Take over the persistent fields of a saved state_store row"""
+        self.interval = row["interval"]
+        self.next_run = row["next_run"]
+        self.last_success = row["last_success"]
+        self.failures = row["failures"]
+
+    def row(self):
+        return {
+            "platform": self.platform,
+            "username": self.username,
+            "interval": self.interval,
+            "next_run": self.next_run,
+            "last_success": self.last_success,
+            "failures": self.failures,
+        }
+
+    @property
+    def key(self):
+        return f"{self.platform}:{self.username}"
+
+    def average_latency(self):
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+    def record_success(self, new_posts, latency, base_interval):
+        """Adapt the interval to how much the poll found and plan the next one"""
+        now = time.time()
+        self.last_run = self.last_success = now
+        self.latencies.append(latency)
+        self.last_new = new_posts
+        self.failures = 0
+        self.last_error = None
+        factor = BUSY_FACTOR if new_posts else QUIET_FACTOR
+        low = min(MIN_INTERVAL, base_interval)
+        high = max(MAX_INTERVAL, base_interval)
+        self.interval = min(high, max(low, self.interval * factor))
+        self.next_run = now + jittered(self.interval)
+
+    def record_deferral(self, retry_at, latency):
+        """The API asked us to come back at retry_at; not counted as an error"""
+        self.last_run = time.time()
+        self.latencies.append(latency)
+        self.next_run = max(retry_at, self.last_run) + jittered(60, 1.0)
+
+    def record_failure(self, error, latency):
+        """Back off exponentially from the current interval"""
+        now = time.time()
+        self.last_run = now
+        self.latencies.append(latency)
+        self.failures += 1
+        self.last_error = str(error)
+        delay = min(MAX_BACKOFF, self.interval * 2 ** (self.failures - 1))
+        self.next_run = now + jittered(max(delay, self.interval))
+
+
+class Scheduler:
+    """
+    Polls every account on its own schedule.
+
+    fetch(platform, username) is called when an account is due and returns
+    how many new posts it found. Accounts that keep posting are polled more
+    often, down to MIN_INTERVAL; quiet ones drift towards MAX_INTERVAL.
+    Errors push the next poll back exponentially, and every delay carries
+    some jitter so accounts don't poll in lockstep. An error with a
+    retry_at attribute (an exhausted API budget) moves the next poll to
+    that time instead.
+
+    Due accounts are polled on their own threads, at most limits[platform]
+    per platform at once (1 for platforms without a limit). An account is
+    never polled twice at the same time, so whatever a poll queues for
+    sending stays in order per account.
+
+    With a state store, every account's interval, next due time, error
+    count and last success are saved after each poll and picked up again by
+    sync() after a restart.
+    """
+
+    def __init__(self, fetch, base_interval, limits=PLATFORM_CONCURRENCY, store=None):
+        self.fetch = fetch
+        self.base_interval = base_interval
+        self.limits = limits
+        self.store = store
+        self.schedules = {}  # "platform:username" -> AccountSchedule
+        self._slots = {}  # platform -> BoundedSemaphore
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = False
+        self._generation = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def sync(self, accounts):
+        """Track exactly the accounts in {platform: [username, ...]}"""
+        with self._wakeup:
+            saved = self.store.load_schedules() if self.store else {}
+            wanted = set()
+            added = []
+            for platform, usernames in accounts.items():
+                for username in usernames:
+                    schedule = AccountSchedule(platform, username, self.base_interval)
+                    wanted.add(schedule.key)
+                    if schedule.key not in self.schedules:
+                        if (platform, username) in saved:
+                            schedule.restore(saved[(platform, username)])
+                        self.schedules[schedule.key] = schedule
+                        added.append(schedule)
+            for key in list(self.schedules):
+                if key not in wanted:
+                    del self.schedules[key]
+            for platform, username in saved:
+                if f"{platform}:{username}" not in wanted:
+                    self.store.remove_schedule(platform, username)
+            self._stagger_due(added)
+            self._wakeup.notify()
+
+    def _stagger_due(self, schedules):
+        """Spread the schedules that are already due over CATCHUP_WINDOW, most overdue first"""
+        now = time.time()
+        due = sorted(
+            (s for s in schedules if s.next_run <= now), key=lambda s: s.next_run
+        )
+        if not due:
+            return
+        step = min(CATCHUP_WINDOW, self.base_interval) / len(due)
+        for i, schedule in enumerate(due):
+            schedule.next_run = now + (i + random.random()) * step
+            self._save(schedule)
+
+    def _save(self, schedule):
+        if not self.store:
+            return
+        try:
+            self.store.save_schedule(schedule.row())
+        except Exception as e:
+            print(f"Could not save auto fetch schedule of {schedule.key}: {e}")
+
+    def set_base_interval(self, interval):
+        """Restart every account's adaptation from a new interval"""
+        with self._wakeup:
+            self.base_interval = interval
+            now = time.time()
+            for schedule in self.schedules.values():
+                schedule.interval = interval
+                if schedule.next_run == float("inf"):
+                    continue  # being polled; planned when the poll finishes
+                schedule.next_run = min(schedule.next_run, now + jittered(interval))
+                self._save(schedule)
+            self._wakeup.notify()
+
+    def status(self):
+        with self._lock:
+            return sorted(self.schedules.values(), key=lambda s: s.next_run)
+
+    def start(self):
+        with self._wakeup:
+            if self._running:
+                return False
+            self._running = True
+            # A loop from before the last stop() may still be mid-poll; it
+            # sees the new generation and exits instead of running twice
+            self._generation += 1
+            generation = self._generation
+        threading.Thread(
+            target=self._loop, args=(generation,), name="auto-fetch", daemon=True
+        ).start()
+        return True
+
+    def stop(self):
+        with self._wakeup:
+            if not self._running:
+                return False
+            self._running = False
+            self._wakeup.notify()
+        return True
+
+    def _slot(self, platform):
+        if platform not in self._slots:
+            self._slots[platform] = threading.BoundedSemaphore(
+                self.limits.get(platform, 1)
+            )
+        return self._slots[platform]
+
+    def _next_due(self, generation):
+        """Wait for the earliest due account whose platform has a free slot"""
+        with self._wakeup:
+            while self._running and self._generation == generation:
+                now = time.time()
+                timeout = None
+                for schedule in sorted(
+                    self.schedules.values(), key=lambda s: s.next_run
+                ):
+                    if schedule.next_run == float("inf"):
+                        break  # this and the rest are being polled
+                    if schedule.next_run > now:
+                        timeout = schedule.next_run - now
+                        break
+                    if self._slot(schedule.platform).acquire(blocking=False):
+                        # Not due again until this poll has finished
+                        schedule.next_run = float("inf")
+                        return schedule
+                # Finished polls free slots and notify
+                self._wakeup.wait(timeout)
+            return None
+
+    def _loop(self, generation):
+        while True:
+            schedule = self._next_due(generation)
+            if schedule is None:
+                return
+            threading.Thread(
+                target=self._poll,
+                args=(schedule,),
+                name=f"auto-fetch-{schedule.key}",
+                daemon=True,
+            ).start()
+
+    def _poll(self, schedule):
+        started = time.monotonic()
+        try:
+            new_posts = self.fetch(schedule.platform, schedule.username)
+        except Exception as e:
+            latency = time.monotonic() - started
+            retry_at = getattr(e, "retry_at", None)
+            if retry_at is not None:
+                print(f"Auto fetch of {schedule.key} deferred: {e}")
+                with self._wakeup:
+                    schedule.record_deferral(retry_at, latency)
+                    self._save(schedule)
+                    self._release(schedule)
+                return
+            print(f"Auto fetch failed for {schedule.key}: {e}")
+            traceback.print_exc()
+            with self._wakeup:
+                schedule.record_failure(e, latency)
+                self._save(schedule)
+                self._release(schedule)
+            return
+        latency = time.monotonic() - started
+        with self._wakeup:
+            schedule.record_success(new_posts or 0, latency, self.base_interval)
+            self._save(schedule)
+            self._release(schedule)
+
+    def _release(self, schedule):
+        self._slot(schedule.platform).release()
+        self._wakeup.notify()
@@ -0,0 +1,192 @@
+import os
+import math
+import atexit
+import struct
+import hashlib
+import threading
+
+BLOOM_HEADER = struct.Struct("<4sIIq")  # magic, bit count, hash count, last rowid
+BLOOM_MAGIC = b"SIBF"
+# Seconds after a change before dirty Bloom filters are written back
+BLOOM_SAVE_DELAY = 30
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing."""
+
+    def __init__(
+        self, capacity=500000, error_rate=0.001, num_bits=None, num_hashes=None
+    ):
+        if num_bits is None:
+            # m = -n ln(p) / (ln 2)^2, k = m/n ln 2
+            num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2)) + 1
+            num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+
+class SeenIndex:
+    """
+    Set of already-sent post IDs, split into namespaces ("x_posts",
+    "instagram_posts", "instagram_stories", ...). The state store stays the
+    source of truth; this class only avoids hitting it for every lookup.
+
+    Without a Bloom filter each namespace is loaded into a Python set on first
+    use. With bloom_dir set, a per-namespace Bloom filter is kept on disk
+    instead: a negative answer is definitive, a positive one is confirmed with
+    an indexed query, so memory stays flat with hundreds of thousands of IDs.
+    Changed filters are written back by flush(), which runs BLOOM_SAVE_DELAY
+    seconds after a change and at exit; each save first folds in the store
+    rows after the filter's rowid watermark and moves the watermark up, so
+    a load only replays what was written since the last save.
+    """
+
+    def __init__(self, store, bloom_dir=None, bloom_capacity=500000):
+        self.store = store
+        self.bloom_dir = bloom_dir
+        self.bloom_capacity = bloom_capacity
+        # Share the store's lock so index and store can't deadlock each other
+        self._lock = store.lock
+        self._sets = {}
+        self._blooms = {}  # namespace -> (BloomFilter, last rowid folded in)
+        self._dirty = set()
+        self._save_timer = None
+        if bloom_dir:
+            atexit.register(self.flush)
+
+    def _bloom_path(self, namespace):
+        return os.path.join(self.bloom_dir, f"seen_{namespace}.bloom")
+
+    def _load_bloom(self, namespace):
+        entry = self._blooms.get(namespace)
+        if entry is not None:
+            return entry
+
+        bloom, last_rowid = None, 0
+        path = self._bloom_path(namespace)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    magic, num_bits, num_hashes, last_rowid = BLOOM_HEADER.unpack(
+                        f.read(BLOOM_HEADER.size)
+                    )
+                    if magic == BLOOM_MAGIC:
+                        bloom = BloomFilter(num_bits=num_bits, num_hashes=num_hashes)
+                        bloom.bits = bytearray(f.read())
+                        if len(bloom.bits) != (num_bits + 7) // 8:
+                            bloom = None
+            except (OSError, struct.error) as e:
+                print(f"Ignoring unreadable Bloom filter {path}: {e}")
+                bloom = None
+        if bloom is None:
+            bloom, last_rowid = BloomFilter(self.bloom_capacity), 0
+
+        entry = [bloom, last_rowid]
+        self._blooms[namespace] = entry
+        if self._catch_up_bloom(namespace):
+            self._mark_dirty(namespace)
+        return entry
+
+    def _catch_up_bloom(self, namespace):
+        """
+        Fold in the store rows after the filter's watermark and advance it;
+        returns whether there were any
+        """
+        entry = self._blooms[namespace]
+        rows = self.store.seen_rows_after(namespace, entry[1])
+        for rowid, post_id in rows:
+            entry[0].add(post_id)
+            entry[1] = max(entry[1], rowid)
+        return bool(rows)
+
+    def _mark_dirty(self, namespace):
+        self._dirty.add(namespace)
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(BLOOM_SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write every changed Bloom filter to disk"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            for namespace in sorted(self._dirty):
+                try:
+                    self._catch_up_bloom(namespace)
+                    self._save_bloom(namespace)
+                except OSError as e:
+                    print(f"Could not save Bloom filter for {namespace}: {e}")
+            self._dirty.clear()
+
+    def _save_bloom(self, namespace):
+        bloom, last_rowid = self._blooms[namespace]
+        os.makedirs(self.bloom_dir, exist_ok=True)
+        path = self._bloom_path(namespace)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                BLOOM_HEADER.pack(
+                    BLOOM_MAGIC, bloom.num_bits, bloom.num_hashes, last_rowid
+                )
+            )
+            f.write(bloom.bits)
+        os.replace(tmp_path, path)
+
+    def _load_set(self, namespace):
+        ids = self._sets.get(namespace)
+        if ids is None:
+            ids = set(self.store.list_seen(namespace))
+            self._sets[namespace] = ids
+        return ids
+
+    def contains(self, namespace, post_id):
+        post_id = str(post_id)
+        with self._lock:
+            if self.bloom_dir:
+                bloom, _ = self._load_bloom(namespace)
+                if post_id not in bloom:
+                    return False
+                return self.store.is_seen(namespace, post_id)
+            return post_id in self._load_set(namespace)
+
+    def add(self, namespace, post_ids):
+        post_ids = [str(pid) for pid in post_ids]
+        if not post_ids:
+            return
+        with self._lock:
+            self.store.add_seen(namespace, post_ids)
+            if self.bloom_dir:
+                # The rowid watermark moves past these when the filter is
+                # saved, which waits for them to be flushed to the store
+                bloom, _ = self._load_bloom(namespace)
+                for post_id in post_ids:
+                    bloom.add(post_id)
+                self._mark_dirty(namespace)
+            else:
+                self._load_set(namespace).update(post_ids)
+
+    def discard(self, namespace, post_ids):
+        """Forget post IDs. Bloom filters keep the bits; the store check covers that."""
+        post_ids = [str(pid) for pid in post_ids]
+        with self._lock:
+            self.store.remove_seen(namespace, post_ids)
+            if namespace in self._sets:
+                self._sets[namespace].difference_update(post_ids)
@@ -0,0 +1,199 @@
+import os
+import time
+import heapq
+import threading
+from collections import deque
+
+import telebot
+
+# Telegram allows about 30 messages per second overall and one per second
+# in a single chat; an album is sent as one message
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 300
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers go into debt: reserve() always takes its
+    tokens and returns how long to wait before the bucket is back at zero.
+    That way a cost larger than the capacity still passes.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= cost
+            return max(0.0, -self.tokens / self.rate)
+
+
+def retry_after(error):
+    """Seconds Telegram asked us to wait for a 429 error, or None"""
+    if not isinstance(error, telebot.apihelper.ApiTelegramException):
+        return None
+    if error.error_code != 429:
+        return None
+    params = (error.result_json or {}).get("parameters") or {}
+    return params.get("retry_after", 5)
+
+
+class SendQueue:
+    """
+    Persistent queue of outbound Telegram messages, in order per chat.
+
+    enqueue() stores the message in the state store and returns at once; a
+    single worker thread delivers them, paced by a global and a per-chat
+    token bucket. Each chat's messages wait in their own deque, and the
+    worker always sends the oldest message of a chat that is ready, so a
+    chat that is rate limited or backing off doesn't hold up the others.
+    An album counts as one send. A 429 reply pauses the chat for
+    retry_after seconds, other errors are retried with exponential backoff
+    and dropped after MAX_ATTEMPTS. Messages still queued at shutdown are
+    sent after the next start.
+    """
+
+    def __init__(self, store, deliver):
+        self.store = store
+        self.deliver = deliver  # deliver(chat_id=..., **payload), raises on failure
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.chat_buckets = {}
+        self._chats = {}  # chat_id -> deque of [send_id, payload, attempts, not_before]
+        self._chat_ready = {}  # chat_id -> epoch time its bucket allows a send
+        self._waiting = []  # heap of (ready_at, chat_id) for chats not ready yet
+        self._ready = []  # heap of (oldest send_id, chat_id) for ready chats
+        self._scheduled = set()  # chats in one of the heaps
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        for send_id, chat_id, payload, attempts, not_before in store.load_sends():
+            self._add(chat_id, [send_id, payload, attempts, not_before])
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="send-queue", daemon=True
+            )
+            self._thread.start()
+            pending = sum(len(messages) for messages in self._chats.values())
+        if pending:
+            print(f"Send queue resuming with {pending} pending messages")
+
+    def enqueue(self, chat_id, **payload):
+        chat_id = str(chat_id)
+        send_id = self.store.enqueue_send(chat_id, payload)
+        with self._wakeup:
+            self._add(chat_id, [send_id, payload, 0, 0.0])
+            self._wakeup.notify()
+        return send_id
+
+    def pending(self):
+        return self.store.count_sends()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _add(self, chat_id, message):
+        self._chats.setdefault(chat_id, deque()).append(message)
+        self._schedule(chat_id)
+
+    def _schedule(self, chat_id):
+        """Put a chat with queued messages back in line, unless it already is"""
+        messages = self._chats.get(chat_id)
+        if not messages:
+            self._chats.pop(chat_id, None)
+            return
+        if chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        ready_at = max(messages[0][3], self._chat_ready.get(chat_id, 0.0))
+        heapq.heappush(self._waiting, (ready_at, chat_id))
+
+    def _next_chat(self):
+        """Wait for a ready chat and take it out of line"""
+        with self._wakeup:
+            while True:
+                now = time.time()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, chat_id = heapq.heappop(self._waiting)
+                    heapq.heappush(self._ready, (self._chats[chat_id][0][0], chat_id))
+                if self._ready:
+                    _, chat_id = heapq.heappop(self._ready)
+                    self._scheduled.discard(chat_id)
+                    return chat_id, self._chats[chat_id][0]
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._wakeup.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                print(f"Error in send queue worker: {e}")
+                time.sleep(5)
+
+    def _step(self):
+        chat_id, message = self._next_chat()
+        try:
+            self._send(chat_id, message)
+        finally:
+            with self._wakeup:
+                self._schedule(chat_id)
+
+    def _send(self, chat_id, message):
+        send_id, payload, attempts, _ = message
+        wait = self.global_bucket.reserve()
+        if wait:
+            time.sleep(wait)
+        # Sent now; the chat is next ready once its bucket is back at zero
+        self._chat_ready[chat_id] = time.time() + self._chat_bucket(chat_id).reserve()
+
+        try:
+            self.deliver(chat_id=chat_id, **payload)
+        except Exception as e:
+            wait = retry_after(e)
+            if wait is not None:
+                print(
+                    f"Telegram flood limit hit, pausing sends to {chat_id} for {wait}s"
+                )
+                self._retry_later(message, attempts, time.time() + wait)
+                return
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                print(f"Dropping message {send_id} after {attempts} attempts: {e}")
+                self._done(chat_id, send_id)
+                return
+            backoff = min(MAX_BACKOFF, 2**attempts)
+            print(f"Send {send_id} failed ({e}), retrying in {backoff}s")
+            self._retry_later(message, attempts, time.time() + backoff)
+            return
+        self._done(chat_id, send_id)
+
+    def _retry_later(self, message, attempts, not_before):
+        self.store.reschedule_send(message[0], attempts, not_before)
+        with self._lock:
+            message[2] = attempts
+            message[3] = not_before
+
+    def _done(self, chat_id, send_id):
+        self.store.remove_send(send_id)
+        with self._lock:
+            self._chats[chat_id].popleft()
@@ -0,0 +1,197 @@
+import os
+import json
+import atexit
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Menu sessions untouched for this long are dropped
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(4 * 1024 * 1024)))
+# JSON file sessions are saved to so open menus survive a restart; unset
+# keeps them in memory only
+SESSION_STORE_FILE = os.getenv("SESSION_STORE_FILE", "")
+SAVE_DELAY = 5
+
+
+def approx_size(value):
+    """Rough in-memory footprint of a JSON-like value, in bytes of its JSON form"""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SessionStore(MutableMapping):
+    """
+    Dict of per-user menu state with LRU and TTL eviction.
+
+    Every read or write of a key refreshes its TTL and moves it to the back
+    of the LRU order. Entries that expired are dropped on access; when the
+    store holds more than max_entries or its values add up to more than
+    max_bytes, the least recently used entries are evicted. Sizes are taken
+    when a value is stored, so values should stay small: keep keys into a
+    shared cache in them, not the data itself.
+
+    With a path, the store is loaded from that JSON file on creation and
+    saved back a few seconds after each change. Keys and values then have
+    to be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        max_entries=SESSION_MAX_ENTRIES,
+        ttl=SESSION_TTL,
+        max_bytes=SESSION_MAX_BYTES,
+        path=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> [value, expires_at, size]
+        self.total_bytes = 0
+        self.evictions = 0
+        self._save_timer = None
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if entry[1] <= now:
+            self._drop(key)
+            self._changed()
+            return None
+        entry[1] = now + self.ttl
+        self._entries.move_to_end(key)
+        return entry
+
+    def __getitem__(self, key):
+        with self.lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                raise KeyError(key)
+            # Callers update the returned dict in place
+            self._changed()
+            return entry[0]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if key in self._entries:
+                self._drop(key)
+            size = approx_size(value)
+            self._entries[key] = [value, time.time() + self.ttl, size]
+            self.total_bytes += size
+            self._evict()
+            self._changed()
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._drop(key)
+            self._changed()
+
+    def __contains__(self, key):
+        with self.lock:
+            return self._live_entry(key) is not None
+
+    def __iter__(self):
+        with self.lock:
+            self.expire()
+            return iter(list(self._entries))
+
+    def __len__(self):
+        with self.lock:
+            self.expire()
+            return len(self._entries)
+
+    def get_or_load(self, key, loader):
+        """Value for key, or loader() stored under key if missing; empty results aren't kept"""
+        try:
+            return self[key]
+        except KeyError:
+            pass
+        value = loader()
+        if value:
+            self[key] = value
+        return value
+
+    def expire(self):
+        """Drop every expired entry; returns how many were dropped"""
+        with self.lock:
+            now = time.time()
+            expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+            for key in expired:
+                self._drop(key)
+            if expired:
+                self._changed()
+            return len(expired)
+
+    def _evict(self):
+        self.expire()
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            self.expire()
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not load sessions from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, value, expires_at in rows:
+            if expires_at > now:
+                size = approx_size(value)
+                self._entries[key] = [value, expires_at, size]
+                self.total_bytes += size
+        self._evict()
+
+    def _changed(self):
+        if not self.path or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def save(self):
+        """Write the sessions to path now"""
+        if not self.path:
+            return
+        with self.lock:
+            self._save_timer = None
+            rows = [
+                [key, value, expires_at]
+                for key, (value, expires_at, _) in self._entries.items()
+            ]
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(rows, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Could not save sessions to {self.path}: {e}")
@@ -0,0 +1,199 @@
+import atexit
+import threading
+from contextlib import contextmanager
+
+
+class WriteBehindState:
+    """
+    Process-wide in-memory view of the state store.
+
+    Media mappings, accounts and sent videos are loaded once and answered from
+    memory. Every mutation is applied in memory immediately and queued; the
+    queue is written to the store in one transaction either when the debounce
+    timer fires or when the outermost transaction() block (a fetch batch)
+    ends. Exposes the same methods as StateStore so callers don't care which
+    one they hold.
+
+    The timer is not pushed back by later writes, so nothing waits longer
+    than flush_delay, and the queue is also flushed at exit. A crash loses at
+    most the last flush_delay seconds of writes; every flush is one SQLite
+    transaction, so the store itself is never left half written.
+    """
+
+    def __init__(self, store, flush_delay=2.0):
+        self.store = store
+        self.flush_delay = flush_delay
+        self.lock = store.lock
+        self._local = threading.local()  # per-thread transaction() depth
+        self._timer = None
+        self._pending = []  # (StateStore method name, args), in order
+        self._pending_seen = {}  # kind -> {post_id: True (added) / False (removed)}
+        self._pending_meta = {}  # key -> value not flushed yet
+
+        with self.lock:
+            self._mappings = store.load_media_mappings()
+            self._accounts = store.load_accounts()
+            self._videos = store.list_sent_videos()
+            self._video_set = set(self._videos)
+        atexit.register(self.flush)
+
+    def _queue(self, method, *args):
+        self._pending.append((method, args))
+        if self._depth() == 0:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write every queued mutation to the store in one transaction"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            try:
+                with self.store.transaction():
+                    for method, args in pending:
+                        getattr(self.store, method)(*args)
+                self._pending_seen = {}
+                self._pending_meta = {}
+            except Exception as e:
+                # Keep the operations so the next flush retries them
+                print(f"Error flushing state to {self.store.db_path}: {e}")
+                self._pending = pending + self._pending
+                self._schedule_flush()
+
+    def _depth(self):
+        return getattr(self._local, "depth", 0)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Batch boundary: queued writes are flushed when this thread's outermost
+        block exits. The lock is only taken to queue and to flush, so other
+        threads keep reading and writing while a batch is being built; a
+        flush they trigger meanwhile writes the queue up to that point, in
+        order.
+        """
+        self._local.depth = self._depth() + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self.flush()
+
+    # Seen post IDs
+
+    def is_seen(self, kind, post_id):
+        post_id = str(post_id)
+        with self.lock:
+            pending = self._pending_seen.get(kind, {})
+            if post_id in pending:
+                return pending[post_id]
+            return self.store.is_seen(kind, post_id)
+
+    def add_seen(self, kind, post_ids):
+        post_ids = [str(pid) for pid in post_ids]
+        if not post_ids:
+            return
+        with self.lock:
+            pending = self._pending_seen.setdefault(kind, {})
+            for post_id in post_ids:
+                pending[post_id] = True
+            self._queue("add_seen", kind, post_ids)
+
+    def remove_seen(self, kind, post_ids):
+        post_ids = [str(pid) for pid in post_ids]
+        if not post_ids:
+            return
+        with self.lock:
+            pending = self._pending_seen.setdefault(kind, {})
+            for post_id in post_ids:
+                pending[post_id] = False
+            self._queue("remove_seen", kind, post_ids)
+
+    def list_seen(self, kind):
+        self.flush()
+        return self.store.list_seen(kind)
+
+    def list_seen_with_mapping(self, kind, key_prefix):
+        self.flush()
+        return self.store.list_seen_with_mapping(kind, key_prefix)
+
+    def seen_rows_after(self, kind, rowid):
+        self.flush()
+        return self.store.seen_rows_after(kind, rowid)
+
+    # Media mapping
+
+    def get_media_mapping(self, key):
+        with self.lock:
+            return list(self._mappings.get(key, []))
+
+    def set_media_mapping(self, key, media_paths):
+        with self.lock:
+            self._mappings[key] = list(media_paths)
+            self._queue("set_media_mapping", key, list(media_paths))
+
+    def remove_media_mapping(self, key):
+        with self.lock:
+            if self._mappings.pop(key, None) is not None:
+                self._queue("remove_media_mapping", key)
+
+    # Accounts
+
+    def add_account(self, platform, username):
+        with self.lock:
+            accounts = self._accounts.setdefault(platform, [])
+            if username in accounts:
+                return False
+            accounts.append(username)
+            self._queue("add_account", platform, username)
+            return True
+
+    def get_accounts(self, platform):
+        with self.lock:
+            return list(self._accounts.get(platform, []))
+
+    # Sent videos
+
+    def is_video_sent(self, video_id):
+        with self.lock:
+            return video_id in self._video_set
+
+    def add_sent_video(self, video_id):
+        with self.lock:
+            if video_id in self._video_set:
+                return
+            self._video_set.add(video_id)
+            self._videos.append(video_id)
+            self._queue("add_sent_video", video_id)
+
+    def list_sent_videos(self):
+        with self.lock:
+            return list(self._videos)
+
+    def list_sent_videos_with_mapping(self, key_prefix):
+        with self.lock:
+            return [v for v in self._videos if f"{key_prefix}_{v}" in self._mappings]
+
+    # Meta
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            if key in self._pending_meta:
+                return self._pending_meta[key]
+            return self.store.get_meta(key, default)
+
+    def set_meta(self, key, value):
+        """Queued like the seen IDs, so it lands in the same flush as them"""
+        with self.lock:
+            self._pending_meta[key] = value
+            self._queue("set_meta", key, value)
@@ -0,0 +1,550 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Keys used in the legacy sent_posts.json for the seen-ID lists
+SEEN_KINDS = ("x_posts", "instagram_posts", "instagram_stories")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_posts (
+    kind TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (kind, post_id)
+);
+CREATE TABLE IF NOT EXISTS media_mapping (
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (key, position)
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    platform TEXT NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (platform, username)
+);
+CREATE TABLE IF NOT EXISTS sent_videos (
+    video_id TEXT PRIMARY KEY,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media_files (
+    path TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    dir TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_files_post
+    ON media_files (platform, post_id, account);
+CREATE INDEX IF NOT EXISTS media_files_dir ON media_files (dir);
+CREATE TABLE IF NOT EXISTS media_dirs (
+    dir TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS telegram_files (
+    key TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    PRIMARY KEY (key, media_type)
+);
+CREATE INDEX IF NOT EXISTS telegram_files_file_id ON telegram_files (file_id);
+CREATE TABLE IF NOT EXISTS send_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    description TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message_id INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS auto_fetch_schedule (
+    platform TEXT NOT NULL,
+    username TEXT NOT NULL,
+    interval REAL NOT NULL,
+    next_run REAL NOT NULL,
+    last_success REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (platform, username)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class StateStore:
+    """
+    SQLite-backed storage for seen post IDs, media mappings, accounts and
+    sent videos. A single connection is shared between threads and guarded
+    by a re-entrant lock, so nested transaction() blocks are allowed.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        self._depth = 0
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one transaction (one fsync per batch)."""
+        with self.lock:
+            outermost = self._depth == 0
+            if outermost:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if outermost:
+                    self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if outermost:
+                    self._conn.execute("COMMIT")
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _executemany(self, sql, rows):
+        with self.transaction():
+            self._conn.executemany(sql, rows)
+
+    # Seen post IDs
+
+    def is_seen(self, kind, post_id):
+        return bool(
+            self._execute(
+                "SELECT 1 FROM seen_posts WHERE kind = ? AND post_id = ?",
+                (kind, str(post_id)),
+            )
+        )
+
+    def add_seen(self, kind, post_ids):
+        now = time.time()
+        self._executemany(
+            "INSERT OR IGNORE INTO seen_posts (kind, post_id, added_at) VALUES (?, ?, ?)",
+            [(kind, str(pid), now) for pid in post_ids],
+        )
+
+    def remove_seen(self, kind, post_ids):
+        self._executemany(
+            "DELETE FROM seen_posts WHERE kind = ? AND post_id = ?",
+            [(kind, str(pid)) for pid in post_ids],
+        )
+
+    def seen_rows_after(self, kind, rowid):
+        """(rowid, post_id) pairs of a kind inserted after the given rowid"""
+        return self._execute(
+            "SELECT rowid, post_id FROM seen_posts WHERE kind = ? AND rowid > ? "
+            "ORDER BY rowid",
+            (kind, rowid),
+        )
+
+    def list_seen(self, kind):
+        """Seen IDs of a kind, oldest first"""
+        rows = self._execute(
+            "SELECT post_id FROM seen_posts WHERE kind = ? ORDER BY rowid", (kind,)
+        )
+        return [r[0] for r in rows]
+
+    def list_seen_with_mapping(self, kind, key_prefix):
+        """Seen IDs of a kind that have a media mapping under key_prefix + '_' + id"""
+        rows = self._execute(
+            "SELECT s.post_id FROM seen_posts s WHERE s.kind = ? AND EXISTS ("
+            "SELECT 1 FROM media_mapping m WHERE m.key = ? || '_' || s.post_id"
+            ") ORDER BY s.rowid",
+            (kind, key_prefix),
+        )
+        return [r[0] for r in rows]
+
+    # Media mapping
+
+    def load_media_mappings(self):
+        """All media mappings as {key: [paths]}"""
+        mappings = {}
+        rows = self._execute(
+            "SELECT key, path FROM media_mapping ORDER BY key, position"
+        )
+        for key, path in rows:
+            mappings.setdefault(key, []).append(path)
+        return mappings
+
+    def get_media_mapping(self, key):
+        rows = self._execute(
+            "SELECT path FROM media_mapping WHERE key = ? ORDER BY position", (key,)
+        )
+        return [r[0] for r in rows]
+
+    def set_media_mapping(self, key, media_paths):
+        with self.transaction():
+            self._conn.execute("DELETE FROM media_mapping WHERE key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO media_mapping (key, position, path) VALUES (?, ?, ?)",
+                [(key, i, p) for i, p in enumerate(media_paths)],
+            )
+
+    def remove_media_mapping(self, key):
+        with self.transaction():
+            self._conn.execute("DELETE FROM media_mapping WHERE key = ?", (key,))
+
+    # Accounts
+
+    def add_account(self, platform, username):
+        """Register an account, returns True if it was not known before"""
+        with self.transaction():
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO accounts (platform, username) VALUES (?, ?)",
+                (platform, username),
+            )
+            return cur.rowcount > 0
+
+    def load_accounts(self):
+        """All accounts as {platform: [usernames]}"""
+        accounts = {}
+        rows = self._execute("SELECT platform, username FROM accounts ORDER BY rowid")
+        for platform, username in rows:
+            accounts.setdefault(platform, []).append(username)
+        return accounts
+
+    def get_accounts(self, platform):
+        rows = self._execute(
+            "SELECT username FROM accounts WHERE platform = ? ORDER BY rowid",
+            (platform,),
+        )
+        return [r[0] for r in rows]
+
+    # Sent videos
+
+    def is_video_sent(self, video_id):
+        return bool(
+            self._execute("SELECT 1 FROM sent_videos WHERE video_id = ?", (video_id,))
+        )
+
+    def add_sent_video(self, video_id):
+        with self.transaction():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sent_videos (video_id, added_at) VALUES (?, ?)",
+                (video_id, time.time()),
+            )
+
+    def list_sent_videos(self):
+        rows = self._execute("SELECT video_id FROM sent_videos ORDER BY rowid")
+        return [r[0] for r in rows]
+
+    def list_sent_videos_with_mapping(self, key_prefix):
+        rows = self._execute(
+            "SELECT v.video_id FROM sent_videos v WHERE EXISTS ("
+            "SELECT 1 FROM media_mapping m WHERE m.key = ? || '_' || v.video_id"
+            ") ORDER BY v.rowid",
+            (key_prefix,),
+        )
+        return [r[0] for r in rows]
+
+    # Media file index
+
+    def add_media_files(self, rows):
+        """rows: (path, platform, account, post_id, dir) tuples"""
+        self._executemany(
+            "INSERT OR REPLACE INTO media_files (path, platform, account, post_id, dir) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def remove_media_files(self, paths):
+        self._executemany(
+            "DELETE FROM media_files WHERE path = ?", [(p,) for p in paths]
+        )
+
+    def find_media_files(self, platform, post_id, account=None):
+        if account is None:
+            rows = self._execute(
+                "SELECT path FROM media_files WHERE platform = ? AND post_id = ? "
+                "ORDER BY path",
+                (platform, str(post_id)),
+            )
+        else:
+            rows = self._execute(
+                "SELECT path FROM media_files WHERE platform = ? AND post_id = ? "
+                "AND account = ? ORDER BY path",
+                (platform, str(post_id), account),
+            )
+        return [r[0] for r in rows]
+
+    def get_media_dir_mtimes(self):
+        return dict(self._execute("SELECT dir, mtime FROM media_dirs"))
+
+    def replace_media_dir(self, dir_path, mtime, rows):
+        """Replace the indexed files of one post directory"""
+        with self.transaction():
+            self._conn.execute("DELETE FROM media_files WHERE dir = ?", (dir_path,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media_files "
+                "(path, platform, account, post_id, dir) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media_dirs (dir, mtime) VALUES (?, ?)",
+                (dir_path, mtime),
+            )
+
+    def remove_media_dirs(self, dir_paths):
+        with self.transaction():
+            for dir_path in dir_paths:
+                self._conn.execute("DELETE FROM media_files WHERE dir = ?", (dir_path,))
+                self._conn.execute("DELETE FROM media_dirs WHERE dir = ?", (dir_path,))
+
+    # Telegram file_ids
+
+    def get_file_id(self, key, media_type):
+        rows = self._execute(
+            "SELECT file_id FROM telegram_files WHERE key = ? AND media_type = ?",
+            (key, media_type),
+        )
+        return rows[0][0] if rows else None
+
+    def set_file_ids(self, rows):
+        """rows: (key, media_type, file_id) tuples"""
+        self._executemany(
+            "INSERT OR REPLACE INTO telegram_files (key, media_type, file_id) "
+            "VALUES (?, ?, ?)",
+            rows,
+        )
+
+    def remove_file_id(self, file_id):
+        with self.transaction():
+            self._conn.execute(
+                "DELETE FROM telegram_files WHERE file_id = ?", (file_id,)
+            )
+
+    # Outbound send queue
+
+    def enqueue_send(self, chat_id, payload):
+        with self.transaction():
+            cur = self._conn.execute(
+                "INSERT INTO send_queue (chat_id, payload, created_at) VALUES (?, ?, ?)",
+                (str(chat_id), json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            return cur.lastrowid
+
+    def load_sends(self):
+        """Every queued message as (id, chat_id, payload, attempts, not_before), oldest first"""
+        rows = self._execute(
+            "SELECT id, chat_id, payload, attempts, not_before FROM send_queue "
+            "ORDER BY id"
+        )
+        return [
+            (send_id, chat_id, json.loads(payload), attempts, not_before)
+            for send_id, chat_id, payload, attempts, not_before in rows
+        ]
+
+    def count_sends(self):
+        return self._execute("SELECT COUNT(*) FROM send_queue")[0][0]
+
+    def reschedule_send(self, send_id, attempts, not_before):
+        with self.transaction():
+            self._conn.execute(
+                "UPDATE send_queue SET attempts = ?, not_before = ? WHERE id = ?",
+                (attempts, not_before, send_id),
+            )
+
+    def remove_send(self, send_id):
+        with self.transaction():
+            self._conn.execute("DELETE FROM send_queue WHERE id = ?", (send_id,))
+
+    # Background jobs
+
+    _JOB_FIELDS = (
+        "id",
+        "kind",
+        "chat_id",
+        "description",
+        "args",
+        "status",
+        "message_id",
+        "error",
+        "created_at",
+        "updated_at",
+    )
+    _JOB_COLUMNS = ", ".join(_JOB_FIELDS)
+
+    def _job_row(self, row):
+        job = dict(zip(self._JOB_FIELDS, row))
+        job["args"] = json.loads(job["args"])
+        return job
+
+    def add_job(self, kind, chat_id, description, args):
+        now = time.time()
+        with self.transaction():
+            cur = self._conn.execute(
+                "INSERT INTO jobs (kind, chat_id, description, args, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (
+                    kind,
+                    str(chat_id),
+                    description,
+                    json.dumps(args, ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+            return cur.lastrowid
+
+    def set_job_message(self, job_id, message_id):
+        with self.transaction():
+            self._conn.execute(
+                "UPDATE jobs SET message_id = ? WHERE id = ?", (message_id, job_id)
+            )
+
+    def get_job(self, job_id):
+        rows = self._execute(
+            f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        )
+        return self._job_row(rows[0]) if rows else None
+
+    def claim_next_job(self):
+        """Mark the oldest queued job as running and return it, or None"""
+        with self.transaction():
+            rows = self._conn.execute(
+                f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE status = 'queued' "
+                "ORDER BY id LIMIT 1"
+            ).fetchall()
+            if not rows:
+                return None
+            job = self._job_row(rows[0])
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+            job["status"] = "running"
+            return job
+
+    def finish_job(self, job_id, status, error=None):
+        with self.transaction():
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def requeue_running_jobs(self):
+        with self.transaction():
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running'"
+            )
+            return cur.rowcount
+
+    def list_jobs(self, limit=10):
+        """Queued and running jobs, then the most recently finished ones"""
+        active = self._execute(
+            f"SELECT {self._JOB_COLUMNS} FROM jobs "
+            "WHERE status IN ('queued', 'running') ORDER BY id"
+        )
+        finished = self._execute(
+            f"SELECT {self._JOB_COLUMNS} FROM jobs "
+            "WHERE status NOT IN ('queued', 'running') ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        )
+        return [self._job_row(r) for r in active + finished]
+
+    # Auto-fetch schedules
+
+    _SCHEDULE_FIELDS = (
+        "platform",
+        "username",
+        "interval",
+        "next_run",
+        "last_success",
+        "failures",
+    )
+
+    def load_schedules(self):
+        """Saved auto-fetch schedules as {(platform, username): row dict}"""
+        rows = self._execute(
+            f"SELECT {', '.join(self._SCHEDULE_FIELDS)} FROM auto_fetch_schedule"
+        )
+        return {(row[0], row[1]): dict(zip(self._SCHEDULE_FIELDS, row)) for row in rows}
+
+    def save_schedule(self, schedule):
+        """Insert or update a schedule from a dict with every schedule field"""
+        with self.transaction():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO auto_fetch_schedule "
+                f"({', '.join(self._SCHEDULE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(schedule[field] for field in self._SCHEDULE_FIELDS),
+            )
+
+    def remove_schedule(self, platform, username):
+        with self.transaction():
+            self._conn.execute(
+                "DELETE FROM auto_fetch_schedule WHERE platform = ? AND username = ?",
+                (platform, username),
+            )
+
+    # Meta / migration
+
+    def get_meta(self, key, default=None):
+        rows = self._execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        with self.transaction():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def migrate_from_json(self, sent_posts_file, sent_videos_file):
+        """One-shot import of the legacy sent_posts.json / sent_videos.json files"""
+        if self.get_meta("json_migrated"):
+            return False
+
+        sent_posts = {}
+        if os.path.exists(sent_posts_file):
+            with open(sent_posts_file, "r") as f:
+                sent_posts = json.load(f)
+        sent_videos = {}
+        if os.path.exists(sent_videos_file):
+            with open(sent_videos_file, "r") as f:
+                sent_videos = json.load(f)
+
+        with self.transaction():
+            for kind in SEEN_KINDS:
+                self.add_seen(kind, sent_posts.get(kind, []))
+            for key, paths in sent_posts.get("media_mapping", {}).items():
+                self.set_media_mapping(key, paths)
+            for platform, usernames in sent_posts.get("accounts", {}).items():
+                for username in usernames:
+                    self.add_account(platform, username)
+            for video_id in sent_videos.get("videos", []):
+                self.add_sent_video(video_id)
+            self.set_meta("json_migrated", str(time.time()))
+
+        if sent_posts or sent_videos:
+            print(f"Migrated legacy JSON state into {self.db_path}")
+        return True
@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+import telebot
+import telebot.apihelper
+from dotenv import load_dotenv
+
+import http_client
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Fail fast on unreachable servers, but give big uploads time to finish
+CONNECT_TIMEOUT = int(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = int(os.getenv("TELEGRAM_READ_TIMEOUT", "600"))
+
+# Base URL of a self-hosted telegram-bot-api server, e.g. http://localhost:8081.
+# Unset means the cloud Bot API at api.telegram.org.
+API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+# A server started with --local can read files straight from this machine's
+# disk, so sends pass file:// paths instead of uploading the bytes
+LOCAL_FILES = bool(API_URL) and os.getenv("TELEGRAM_API_LOCAL", "1").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Upload limits: 50 MB through the cloud API, 2000 MB through a local server
+_default_upload_mb = "2000" if API_URL else "50"
+UPLOAD_MAX_BYTES = (
+    int(os.getenv("TELEGRAM_UPLOAD_MAX_MB", _default_upload_mb)) * 1024 * 1024
+)
+
+if API_URL:
+    telebot.apihelper.API_URL = API_URL + "/bot{0}/{1}"
+    telebot.apihelper.FILE_URL = API_URL + "/file/bot{0}/{1}"
+
+telebot.apihelper.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+telebot.apihelper.READ_TIMEOUT = READ_TIMEOUT
+# One pooled session for every thread instead of a new one per thread that
+# is thrown away every 10 minutes, so sends reuse warm connections
+telebot.apihelper.session = http_client.new_session()
+telebot.apihelper.SESSION_TIME_TO_LIVE = None
+
+if not BOT_TOKEN or BOT_TOKEN.strip() == "":
+    raise ValueError("BOT_TOKEN is not set or is invalid. Please check your .env file.")
+
+# The process-wide Telegram client; every module sends through this one
+bot = telebot.TeleBot(BOT_TOKEN)
+
+
+def local_file(path):
+    """file:// URI the local server can read path from, or None in cloud mode"""
+    if not LOCAL_FILES:
+        return None
+    return Path(path).resolve().as_uri()
@@ -0,0 +1,162 @@
+import os
+import json
+import subprocess
+
+import media_batches
+
+AUDIO_BITRATE = 128_000
+MIN_VIDEO_BITRATE = 150_000
+# Container overhead and encoder overshoot eat into the size budget
+SIZE_HEADROOM = 0.92
+
+# Highest resolution worth spending a given video bitrate on
+RESOLUTION_STEPS = (
+    (2_500_000, 1080),
+    (1_200_000, 720),
+    (600_000, 480),
+    (0, 360),
+)
+
+
+def probe(path):
+    """Return (duration in seconds, total bitrate in bit/s) of a media file"""
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration,bit_rate",
+            "-of",
+            "json",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    fmt = json.loads(result.stdout).get("format", {})
+    duration = float(fmt.get("duration") or 0)
+    bit_rate = int(fmt.get("bit_rate") or 0)
+    if not bit_rate and duration:
+        bit_rate = int(os.path.getsize(path) * 8 / duration)
+    return duration, bit_rate
+
+
+def target_video_bitrate(duration, max_bytes):
+    """Video bitrate that makes duration seconds of video plus audio fit max_bytes"""
+    total = max_bytes * 8 * SIZE_HEADROOM / duration
+    return int(total - AUDIO_BITRATE)
+
+
+def target_height(video_bitrate):
+    for min_bitrate, height in RESOLUTION_STEPS:
+        if video_bitrate >= min_bitrate:
+            return height
+    return RESOLUTION_STEPS[-1][1]
+
+
+def _run_ffmpeg(args):
+    process = subprocess.run(["ffmpeg", "-y", *args], capture_output=True, text=True)
+    if process.returncode != 0:
+        print(f"ffmpeg failed: {process.stderr[-500:]}")
+        return False
+    return True
+
+
+def faststart(path):
+    """Remux an MP4 so the moov atom comes first (no re-encode)"""
+    tmp_path = path + ".faststart.mp4"
+    ok = _run_ffmpeg(
+        ["-i", path, "-c", "copy", "-map", "0", "-movflags", "+faststart", tmp_path]
+    )
+    if ok:
+        os.replace(tmp_path, path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return ok
+
+
+def _encode(path, out_path, video_bitrate):
+    height = target_height(video_bitrate)
+    return _run_ffmpeg(
+        [
+            "-i",
+            path,
+            "-vf",
+            f"scale=-2:'min({height},ih)'",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-b:v",
+            str(video_bitrate),
+            "-maxrate",
+            str(video_bitrate),
+            "-bufsize",
+            str(video_bitrate * 2),
+            "-c:a",
+            "aac",
+            "-b:a",
+            str(AUDIO_BITRATE),
+            "-movflags",
+            "+faststart",
+            out_path,
+        ]
+    )
+
+
+def fit_for_upload(path, max_bytes=None):
+    """
+    Make a video uploadable through the Bot API.
+
+    Files already within max_bytes (the upload limit by default) only get a
+    faststart remux. Bigger ones are re-encoded to H.264/AAC at a bitrate,
+    and resolution, predicted from their duration to fit the limit. Returns
+    the path of the file to send: an .mp4 next to the original, or the
+    original itself if it could not be made to fit.
+    """
+    if max_bytes is None:
+        max_bytes = media_batches.UPLOAD_MAX_BYTES
+    try:
+        size = os.path.getsize(path)
+        if size <= max_bytes:
+            if path.lower().endswith((".mp4", ".mov")):
+                faststart(path)
+            return path
+
+        duration, bit_rate = probe(path)
+        if duration <= 0:
+            print(f"Cannot transcode {path}: unknown duration")
+            return path
+        video_bitrate = target_video_bitrate(duration, max_bytes)
+        if video_bitrate < MIN_VIDEO_BITRATE:
+            print(f"{path} is too long to fit {max_bytes // 1048576} MB, sending as is")
+            return path
+
+        predicted = (video_bitrate + AUDIO_BITRATE) * duration / 8
+        print(
+            f"Transcoding {path}: {size / 1048576:.1f} MB at {bit_rate // 1000} kbit/s -> "
+            f"{video_bitrate // 1000} kbit/s, {target_height(video_bitrate)}p, "
+            f"~{predicted / 1048576:.1f} MB"
+        )
+        out_path = os.path.splitext(path)[0] + ".fit.mp4"
+        # Encoders overshoot on some content, so allow one tighter second pass
+        for _ in range(2):
+            if not _encode(path, out_path, video_bitrate):
+                break
+            if os.path.getsize(out_path) <= max_bytes:
+                final_path = os.path.splitext(path)[0] + ".mp4"
+                os.replace(out_path, final_path)
+                if final_path != path:
+                    os.remove(path)
+                return final_path
+            video_bitrate = int(video_bitrate * 0.85)
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        print(f"Could not fit {path} into {max_bytes // 1048576} MB")
+        return path
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        # ffmpeg / ffprobe missing or unreadable file: send the original
+        print(f"Error preparing {path} for upload: {e}")
+        return path
@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+
+# Priorities of Twitter API callers: commands someone is waiting on, and
+# auto fetch polling which can just as well run a little later
+MANUAL = "manual"
+BACKGROUND = "background"
+
+# Calls of each endpoint's window that background polling leaves untouched,
+# so manual commands still get through once polling has used up the rest
+MANUAL_RESERVE = int(os.getenv("TWITTER_MANUAL_RESERVE", "2"))
+# Wait assumed when a 429 carries no x-rate-limit-reset header
+DEFAULT_RESET = 15 * 60
+
+
+class RateLimited(Exception):
+    """
+    Raised instead of calling an endpoint whose budget is used up. retry_at
+    is the epoch time its window resets; callers should give up and try
+    again then rather than sleeping.
+    """
+
+    def __init__(self, endpoint, retry_at):
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+        super().__init__(
+            f"Twitter rate limit for {endpoint} reached, resets at "
+            f"{time.strftime('%H:%M:%S', time.localtime(retry_at))}"
+        )
+
+
+class _Window:
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+
+
+class RateLimitBudget:
+    """
+    Tracks the Twitter API rate limit of each endpoint from the
+    x-rate-limit-* headers of its responses.
+
+    reserve() takes one call from an endpoint's budget or raises
+    RateLimited without waiting. Background callers also stop
+    MANUAL_RESERVE calls short of the limit. Endpoints that haven't
+    answered yet, or whose window has reset, are not limited.
+    """
+
+    def __init__(self, manual_reserve=MANUAL_RESERVE):
+        self.manual_reserve = manual_reserve
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _window(self, endpoint):
+        window = self._windows.get(endpoint)
+        if window is None:
+            window = self._windows[endpoint] = _Window()
+        if window.reset and window.reset <= time.time():
+            window.remaining = None
+            window.reset = 0.0
+        return window
+
+    def reserve(self, endpoint, priority=MANUAL):
+        with self._lock:
+            window = self._window(endpoint)
+            if window.remaining is None:
+                return
+            floor = self.manual_reserve if priority == BACKGROUND else 0
+            if window.remaining <= floor:
+                raise RateLimited(endpoint, window.reset)
+            window.remaining -= 1
+
+    def update(self, endpoint, response):
+        """Record the rate limit headers of an endpoint's response"""
+        headers = response.headers
+        with self._lock:
+            window = self._window(endpoint)
+            try:
+                if "x-rate-limit-limit" in headers:
+                    window.limit = int(headers["x-rate-limit-limit"])
+                if "x-rate-limit-remaining" in headers:
+                    window.remaining = int(headers["x-rate-limit-remaining"])
+                if "x-rate-limit-reset" in headers:
+                    window.reset = float(headers["x-rate-limit-reset"])
+            except ValueError:
+                pass
+            if response.status_code == 429:
+                window.remaining = 0
+                if window.reset <= time.time():
+                    window.reset = time.time() + DEFAULT_RESET
+                raise RateLimited(endpoint, window.reset)
+
+    def status(self):
+        """{endpoint: (remaining, limit, reset)} for endpoints with a known budget"""
+        with self._lock:
+            return {
+                endpoint: (window.remaining, window.limit, window.reset)
+                for endpoint in list(self._windows)
+                for window in [self._window(endpoint)]
+                if window.remaining is not None
+            }
+
+
+budget = RateLimitBudget()
@@ -2,191 +2,312 @@ import os
 import json
 import time
 import telebot
-import requests
 from urllib.parse import urlparse
 import random
-import uuid
+import threading
 from dotenv import load_dotenv
 
+import http_client
+import telegram_api
+import state_store
+import state_cache
+import media_index
+import seen_index
+import blob_store
+import file_id_cache
+import send_queue
+import media_batches
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
 load_dotenv()  # Load environment variables from .env
 
 # Define constants and paths
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 TWITTER_CACHE_EXPIRY = 1800
+STATE_FLUSH_DELAY = 2  # seconds to batch state writes before flushing
 
 # File paths
 SENT_POSTS_FILE = "d:/coding_workspace/telegram/sent_posts.json"
 TWITTER_CACHE_FILE = "d:/coding_workspace/telegram/twitter_cache.json"
 SENT_VIDEOS_FILE = "d:/coding_workspace/telegram/sent_videos.json"
 MEDIA_DIR = "d:/coding_workspace/telegram/media"
-
-# Create bot instance
-bot = telebot.TeleBot(BOT_TOKEN)
+TWITTER_MEDIA_DIR = os.path.join(MEDIA_DIR, "twitter")
+INSTAGRAM_POSTS_DIR = os.path.join(MEDIA_DIR, "instagram", "posts")
+INSTAGRAM_STORIES_DIR = os.path.join(MEDIA_DIR, "instagram", "stories")
+BILIBILI_MEDIA_DIR = os.path.join(MEDIA_DIR, "bilibili")
+STATE_DB_FILE = "d:/coding_workspace/telegram/state.db"
+SEEN_BLOOM_DIR = "d:/coding_workspace/telegram/seen_index"
+BLOB_DIR = os.path.join(MEDIA_DIR, ".blobs")  # content-addressed media bodies
+
+# Keep on-disk Bloom filters instead of in-memory sets for seen post IDs
+SEEN_BLOOM_FILTER = os.getenv("SEEN_BLOOM_FILTER", "").lower() in ("1", "true", "yes")
+
+# Shared Telegram client
+bot = telegram_api.bot
+
+# State store is opened lazily by get_store()
+_store = None
+_seen_index = None
+_media_index = None
+_blob_store = blob_store.BlobStore(BLOB_DIR)
+_file_id_cache = None
+_send_queue = None
+_store_lock = threading.Lock()
 
 
 def get_user_media_dir(platform, username):
     """Create and return a directory path specific for a platform+username"""
     dir_path = os.path.join(MEDIA_DIR, f"{platform}_{username}")
-    os.makedirs(dir_path, exist_ok=True)
-    return dir_path
+    return make_account_dir(platform, username, dir_path)
 
 
-def generate_media_filename(prefix, id_value, extension):
-    """Generate a unique filename using UUID to prevent collisions"""
-    unique_id = str(uuid.uuid4())[:8]
-    return f"{prefix}_{id_value}_{unique_id}{extension}"
-
-
-def load_sent_posts():
-    if os.path.exists(SENT_POSTS_FILE):
-        with open(SENT_POSTS_FILE, "r") as f:
-            data = json.load(f)
-            # Ensure all required fields exist
-            if "x_posts" not in data:
-                data["x_posts"] = []
-            if "instagram_posts" not in data:
-                data["instagram_posts"] = []
-            if "instagram_stories" not in data:
-                data["instagram_stories"] = []
-            if "media_mapping" not in data:
-                data["media_mapping"] = {}
-            if "accounts" not in data:
-                data["accounts"] = {"twitter": [], "instagram": [], "bilibili": []}
-            return data
-    return {
-        "x_posts": [],
-        "instagram_posts": [],
-        "instagram_stories": [],
-        "media_mapping": {},  # keep track of file paths
-        "accounts": {"twitter": [], "instagram": [], "bilibili": []},  # track accounts
-    }
+def generate_media_filename(prefix, id_value, extension, index=0):
+    """
+    Filename of a post's index-th media file. It is the same on every fetch,
+    so a .part file left by an interrupted download is resumed next time.
+    """
+    return f"{prefix}_{id_value}_{index}{extension}"
+
+
+def get_store():
+    """Return the process-wide state store, opening it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            db = state_store.StateStore(STATE_DB_FILE)
+            db.migrate_from_json(SENT_POSTS_FILE, SENT_VIDEOS_FILE)
+            _store = state_cache.WriteBehindState(db, flush_delay=STATE_FLUSH_DELAY)
+        return _store
+
+
+def state_transaction():
+    """Context manager marking a batch of state writes; they are flushed on exit"""
+    return get_store().transaction()
+
+
+def flush_state():
+    """Write any pending state changes to disk now"""
+    if _store is not None:
+        _store.flush()
+    if _seen_index is not None:
+        _seen_index.flush()
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it into place"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def get_seen_index():
+    """Return the process-wide seen-ID index, built on first use"""
+    global _seen_index
+    store = get_store()
+    with _store_lock:
+        if _seen_index is None:
+            bloom_dir = SEEN_BLOOM_DIR if SEEN_BLOOM_FILTER else None
+            _seen_index = seen_index.SeenIndex(store, bloom_dir=bloom_dir)
+        return _seen_index
+
+
+def is_post_seen(kind, post_id):
+    """Check whether a post ID of the given kind (e.g. "x_posts") was already sent"""
+    return get_seen_index().contains(kind, post_id)
+
+
+def mark_posts_seen(kind, post_ids):
+    """Record post IDs of the given kind as sent"""
+    get_seen_index().add(kind, post_ids)
+
+
+def unmark_posts_seen(kind, post_ids):
+    """Forget post IDs of the given kind so they can be fetched again"""
+    get_seen_index().discard(kind, post_ids)
+
+
+def get_seen_posts(kind, mapping_prefix=None):
+    """
+    List seen post IDs of a kind, oldest first. When mapping_prefix is given,
+    only IDs with a media mapping under "<mapping_prefix>_<id>" are returned.
+    """
+    if mapping_prefix is None:
+        return get_store().list_seen(kind)
+    return get_store().list_seen_with_mapping(kind, mapping_prefix)
 
 
-def save_sent_posts(sent_posts):
-    # Ensure required fields exist
-    if "media_mapping" not in sent_posts:
-        sent_posts["media_mapping"] = {}
-    if "accounts" not in sent_posts:
-        sent_posts["accounts"] = {"twitter": [], "instagram": [], "bilibili": []}
+def get_media_mapping(key):
+    """Return the media paths stored for a full mapping key"""
+    return get_store().get_media_mapping(key)
 
-    with open(SENT_POSTS_FILE, "w") as f:
-        json.dump(sent_posts, f)
+
+def remove_media_mapping(key):
+    get_store().remove_media_mapping(key)
 
 
 def get_post_media_files(platform, post_id):
     """Get media files associated with a specific post"""
-    sent_posts = load_sent_posts()
     # Try the direct key first
     key = f"{platform}_{post_id}"
-    if key in sent_posts.get("media_mapping", {}):
-        paths = sent_posts["media_mapping"][key]
+    paths = get_media_mapping(key)
+    if paths:
         # Verify the files exist
         valid_paths = [p for p in paths if os.path.exists(p)]
         if valid_paths:
             return valid_paths
 
-    # Try a fallback search by scanning media directories
+    # Fall back to the media index, which covers files from any account
     if platform == "twitter":
-        platform_dir = "twitter"
+        index_platform = "twitter"
     elif platform == "instagram_post":
-        platform_dir = "instagram"
+        index_platform = "instagram_posts"
     elif platform == "instagram_story":
-        platform_dir = "instagram_stories"
+        index_platform = "instagram_stories"
     elif platform == "bilibili":
-        platform_dir = "bilibili"
+        index_platform = "bilibili"
     else:
         return []
 
-    # Search for files matching the post_id
-    matching_files = []
-    for root, _, files in os.walk(MEDIA_DIR):
-        if platform_dir in root:
-            for file in files:
-                if post_id in file:
-                    full_path = os.path.join(root, file)
-                    matching_files.append(full_path)
-
-    return matching_files
+    return get_media_index().find(index_platform, post_id)
 
 
-def save_media_mapping(platform, post_id, media_paths):
-    """Save mapping between post ID and its media files"""
-    sent_posts = load_sent_posts()
-    if "media_mapping" not in sent_posts:
-        sent_posts["media_mapping"] = {}
+def save_media_mapping(platform, post_id, media_paths, dedup=True):
+    """
+    Save mapping between post ID and its media files. Pass dedup=False if
+    dedup_media() already ran on the files, e.g. before a state_transaction()
+    so hashing doesn't hold up the batch.
+    """
     # Use proper key format for consistent retrieval
-    sent_posts["media_mapping"][f"{platform}_{post_id}"] = media_paths
-    save_sent_posts(sent_posts)
+    get_store().set_media_mapping(f"{platform}_{post_id}", media_paths)
+    if dedup:
+        dedup_media(media_paths)
+    get_media_index().add_files(media_paths)
+
+
+def dedup_media(media_paths):
+    """Hardlink media files into the content-addressed blob store"""
+    for path in media_paths:
+        if os.path.isfile(path):
+            _blob_store.ingest(path)
+
+
+def get_blob_store():
+    return _blob_store
+
+
+def get_file_id_cache():
+    """Return the process-wide cache of uploaded Telegram file_ids"""
+    global _file_id_cache
+    store = get_store()
+    with _store_lock:
+        if _file_id_cache is None:
+            _file_id_cache = file_id_cache.FileIdCache(store.store)
+        return _file_id_cache
+
+
+def get_media_index():
+    """Return the process-wide media file index"""
+    global _media_index
+    store = get_store()
+    with _store_lock:
+        if _media_index is None:
+            _media_index = media_index.MediaIndex(store.store, MEDIA_DIR)
+        return _media_index
+
+
+def find_post_media(platform, post_id, account=None):
+    """
+    Look up media files for a post in the media index.
+
+    Args:
+        platform: twitter, instagram_posts, instagram_stories or bilibili
+        post_id: Post / story / video ID
+        account: Account directory name; None matches any account
+    """
+    return get_media_index().find(platform, post_id, account)
+
+
+def unindex_media(media_paths):
+    """Drop deleted files from the media index"""
+    get_media_index().remove_files(media_paths)
+
+
+def rescan_media_index():
+    """Re-sync the media index with MEDIA_DIR, listing only changed directories"""
+    relisted = get_media_index().rescan()
+    print(f"Media index rescan done, {relisted} directories re-listed")
+    return relisted
+
+
+def _account_platform_key(platform):
+    """Map the platform names used by callers onto account list keys"""
+    if platform == "x":
+        return "twitter"
+    if platform in ("instagram_posts", "instagram_stories"):
+        return "instagram"
+    return platform
 
 
 def register_account(platform, username):
     """Register an account in the platform's account list"""
-    sent_posts = load_sent_posts()
-    if "accounts" not in sent_posts:
-        sent_posts["accounts"] = {"twitter": [], "instagram": [], "bilibili": []}
+    get_store().add_account(_account_platform_key(platform), username)
 
-    platform_key = platform
-    if platform == "x":
-        platform_key = "twitter"
 
-    if username not in sent_posts["accounts"].get(platform_key, []):
-        if platform_key not in sent_posts["accounts"]:
-            sent_posts["accounts"][platform_key] = []
-        sent_posts["accounts"][platform_key].append(username)
-        save_sent_posts(sent_posts)
+def make_account_dir(platform, username, dir_path):
+    """Create an account's media directory, registering the account if it is new"""
+    if not os.path.isdir(dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+        register_account(platform, username)
+    return dir_path
 
 
 def scan_and_register_accounts():
-    """Scan media directories to discover and register existing accounts"""
+    """
+    Scan media directories to discover and register existing accounts.
+    Run once at startup; afterwards new accounts are registered as their
+    directories are created.
+    """
     if not os.path.exists(MEDIA_DIR):
         return
 
     # Dictionary to hold found accounts
     found_accounts = {"twitter": set(), "instagram": set(), "bilibili": set()}
 
-    # Scan directory structure for account folders
+    # Current layout: <platform dir>/<account>/<post_id>/
+    for platform, prefix in media_index.PLATFORM_DIRS.items():
+        platform_dir = os.path.join(MEDIA_DIR, *prefix)
+        if os.path.isdir(platform_dir):
+            for item in os.listdir(platform_dir):
+                if os.path.isdir(os.path.join(platform_dir, item)):
+                    found_accounts[_account_platform_key(platform)].add(item)
+
+    # Legacy layout: <platform>_<account>/ directly in MEDIA_DIR
     for item in os.listdir(MEDIA_DIR):
         path = os.path.join(MEDIA_DIR, item)
         if os.path.isdir(path):
             parts = item.split("_", 1)  # Split at first underscore
             if len(parts) == 2:
                 platform, username = parts
-                if platform == "twitter":
-                    found_accounts["twitter"].add(username)
-                elif platform == "instagram":
-                    found_accounts["instagram"].add(username)
-                elif platform == "instagram_stories":
-                    # Extract username from instagram_stories_username
-                    found_accounts["instagram"].add(username)
-                elif platform == "bilibili":
-                    found_accounts["bilibili"].add(username)
-
-    # Register all found accounts
-    sent_posts = load_sent_posts()
-    for platform, accounts in found_accounts.items():
-        for account in accounts:
-            if account not in sent_posts["accounts"].get(platform, []):
-                if platform not in sent_posts["accounts"]:
-                    sent_posts["accounts"][platform] = []
-                sent_posts["accounts"][platform].append(account)
-                print(f"Registered existing {platform} account: {account}")
-
-    save_sent_posts(sent_posts)
-    return found_accounts
+                if platform in found_accounts:
+                    found_accounts[platform].add(username)
 
+    # Register all found accounts in one batch
+    store = get_store()
+    with store.transaction():
+        for platform, accounts in found_accounts.items():
+            for account in sorted(accounts):
+                if store.add_account(platform, account):
+                    print(f"Registered existing {platform} account: {account}")
 
-def get_accounts_by_platform(platform):
-    """Get all accounts for a given platform"""
-    # Scan for existing accounts first
-    scan_and_register_accounts()
+    return found_accounts
 
-    sent_posts = load_sent_posts()
-    platform_key = platform
-    if platform == "x":
-        platform_key = "twitter"
 
-    return sent_posts.get("accounts", {}).get(platform_key, [])
+def get_accounts_by_platform(platform):
+    """Get all accounts for a given platform from the in-memory account cache"""
+    return get_store().get_accounts(_account_platform_key(platform))
 
 
 def load_twitter_cache():
@@ -200,33 +321,170 @@ def load_twitter_cache():
 
 def save_twitter_cache(tweets_data):
     cache = {"timestamp": time.time(), "tweets": tweets_data}
-    with open(TWITTER_CACHE_FILE, "w") as f:
-        json.dump(cache, f)
+    write_json_atomic(TWITTER_CACHE_FILE, cache)
 
 
-def load_sent_videos():
-    """
-    Loads a JSON with Bilibili/videos that have been processed to avoid duplicates.
-    """
-    if os.path.exists(SENT_VIDEOS_FILE):
-        with open(SENT_VIDEOS_FILE, "r") as f:
-            return json.load(f)
-    return {"videos": []}
+def is_video_sent(video_id):
+    """Check whether a Bilibili video was already processed"""
+    return get_store().is_video_sent(video_id)
+
+
+def mark_video_sent(video_id):
+    """Record a Bilibili video as processed to avoid duplicates"""
+    get_store().add_sent_video(video_id)
+
+
+def get_sent_videos(mapping_prefix=None):
+    """List processed Bilibili video IDs, oldest first, optionally only mapped ones"""
+    if mapping_prefix is None:
+        return get_store().list_sent_videos()
+    return get_store().list_sent_videos_with_mapping(mapping_prefix)
 
 
-def save_sent_videos(sent_videos):
+def _prepare_media_item(cache, path, mtype):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if mtype == "photo" and size > media_batches.PHOTO_MAX_BYTES:
+        mtype = "document"  # too big for a photo, send the original file
+    return {
+        "path": path,
+        "type": mtype,
+        "size": size,
+        "file_id": cache.get(path, mtype),
+    }
+
+
+def _send_media_once(chat_id, batch, caption, markup):
+    with ExitStack() as stack:
+        inputs = [
+            item["file_id"]
+            or telegram_api.local_file(item["path"])
+            or stack.enter_context(open(item["path"], "rb"))
+            for item in batch
+        ]
+        if len(inputs) == 1:
+            mtype = batch[0]["type"]
+            if mtype == "video":
+                send = bot.send_video
+            elif mtype == "document":
+                send = bot.send_document
+            else:
+                send = bot.send_photo
+            return [send(chat_id, inputs[0], caption=caption, reply_markup=markup)]
+
+        media = []
+        for i, (item, media_input) in enumerate(zip(batch, inputs)):
+            if item["type"] == "video":
+                input_type = telebot.types.InputMediaVideo
+            else:
+                input_type = telebot.types.InputMediaPhoto
+            media.append(input_type(media_input, caption=caption if i == 0 else None))
+        return bot.send_media_group(chat_id, media)
+
+
+def _send_media_batch(chat_id, batch, caption, markup, cache):
+    try:
+        messages = _send_media_once(chat_id, batch, caption, markup)
+    except telebot.apihelper.ApiTelegramException as e:
+        used = [item["file_id"] for item in batch if item["file_id"]]
+        if not used or send_queue.retry_after(e) is not None:
+            raise
+        # file_ids are tied to the bot; after a token change they are rejected
+        print(f"Cached file_id rejected ({e}), uploading the files again")
+        for file_id in used:
+            cache.forget(file_id)
+        for item in batch:
+            item["file_id"] = None
+        messages = _send_media_once(chat_id, batch, caption, markup)
+
+    for item, message in zip(batch, messages):
+        if item["file_id"] is None:
+            new_file_id = file_id_cache.message_file_id(message, item["type"])
+            if new_file_id:
+                cache.put(item["path"], item["type"], new_file_id)
+    return messages
+
+
+def send_media(chat_id, media_paths, media_types=None, caption=None, reply_markup=None):
     """
-    Saves the JSON that tracks which videos have been processed.
+    Send local media files as single messages and albums.
+
+    Files are grouped into evenly sized albums of at most 10; documents and
+    files too large to upload go out on their own so they can't sink an
+    album. Items are prepared in parallel (size checks and file_id lookups,
+    which hash the file) and sent in order. Files uploaded before are sent
+    by their Telegram file_id instead of being uploaded again.
+
+    A failed batch is logged and skipped; an error is raised only if
+    nothing could be sent. reply_markup is attached to the last message if
+    that is not an album. Returns the sent messages.
     """
-    with open(SENT_VIDEOS_FILE, "w") as f:
-        json.dump(sent_videos, f)
+    media_types = [
+        media_types[i] if media_types and i < len(media_types) else "photo"
+        for i in range(len(media_paths))
+    ]
+    cache = get_file_id_cache()
+    with ThreadPoolExecutor(max_workers=min(8, len(media_paths))) as pool:
+        items = list(
+            pool.map(
+                lambda pair: _prepare_media_item(cache, *pair),
+                zip(media_paths, media_types),
+            )
+        )
+
+    batches = media_batches.plan_batches(items)
+    messages = []
+    error = None
+    for i, batch in enumerate(batches):
+        markup = reply_markup if i == len(batches) - 1 and len(batch) == 1 else None
+        # The caption goes on the first batch that actually gets through
+        text = caption if not messages else None
+        for attempt in range(3):
+            try:
+                messages.extend(_send_media_batch(chat_id, batch, text, markup, cache))
+                break
+            except Exception as e:
+                wait = send_queue.retry_after(e)
+                if wait is not None and not messages:
+                    raise  # nothing sent yet, the caller can simply retry
+                if wait is None or attempt == 2:
+                    print(f"Error sending media batch {i + 1}/{len(batches)}: {e}")
+                    error = e
+                    break
+                time.sleep(wait)
+
+    if not messages and error is not None:
+        raise error
+    return messages
+
+
+def deliver_to_telegram(
+    message_text, media_paths=None, media_types=None, media_url=None, chat_id=None
+):
+    """Send message and/or media to Telegram, raising on failure"""
+    if chat_id is None:
+        chat_id = CHAT_ID
+
+    if media_paths and len(media_paths) > 0:
+        send_media(chat_id, media_paths, media_types, caption=message_text)
+    elif media_url:
+        try:
+            bot.send_photo(chat_id, media_url, caption=message_text)
+        except Exception as e:
+            if send_queue.retry_after(e) is not None:
+                raise
+            bot.send_message(chat_id, f"{message_text}\n\nMedia: {media_url}")
+    else:
+        bot.send_message(chat_id, message_text)
 
 
 def send_to_telegram(
     message_text, media_paths=None, media_types=None, media_url=None, chat_id=None
 ):
     """
-    Send message and/or media to Telegram.
+    Send message and/or media to Telegram right away.
 
     Args:
         message_text: Text message to send
@@ -234,84 +492,134 @@ def send_to_telegram(
         media_types: List of media types (photo/video) corresponding to media_paths
         media_url: Direct URL to a media file (alternative to media_paths)
         chat_id: Specific chat ID to send to (defaults to CHAT_ID)
-    """
-    if chat_id is None:
-        chat_id = CHAT_ID
 
+    Returns:
+        bool: True if the message was sent
+    """
     try:
-        if media_paths and len(media_paths) > 0:
-            if len(media_paths) == 1:
-                media_path = media_paths[0]
-                mtype = media_types[0] if media_types else "photo"
-                if mtype == "video":
-                    with open(media_path, "rb") as vid:
-                        bot.send_video(chat_id, vid, caption=message_text)
-                else:
-                    with open(media_path, "rb") as img:
-                        bot.send_photo(chat_id, img, caption=message_text)
-            else:
-                media = []
-                for i, path in enumerate(media_paths):
-                    mtype = media_types[i] if i < len(media_types) else "photo"
-                    if mtype == "video":
-                        with open(path, "rb") as vid:
-                            media.append(
-                                telebot.types.InputMediaVideo(
-                                    vid, caption=message_text if i == 0 else None
-                                )
-                            )
-                    else:
-                        with open(path, "rb") as img:
-                            media.append(
-                                telebot.types.InputMediaPhoto(
-                                    img, caption=message_text if i == 0 else None
-                                )
-                            )
-                bot.send_media_group(chat_id, media)
-        elif media_url:
-            try:
-                bot.send_photo(chat_id, media_url, caption=message_text)
-            except Exception:
-                bot.send_message(chat_id, f"{message_text}\n\nMedia: {media_url}")
-        else:
-            bot.send_message(chat_id, message_text)
+        deliver_to_telegram(message_text, media_paths, media_types, media_url, chat_id)
+        return True
     except Exception as e:
         print(f"Error sending message: {e}")
+        return False
+
 
+def get_send_queue():
+    """Return the persistent outbound send queue, starting its worker"""
+    global _send_queue
+    store = get_store()
+    with _store_lock:
+        if _send_queue is None:
+            _send_queue = send_queue.SendQueue(store.store, deliver_to_telegram)
+    _send_queue.start()
+    return _send_queue
 
-def download_media(url, path, retries=3, timeout=10):
+
+def queue_to_telegram(
+    message_text, media_paths=None, media_types=None, media_url=None, chat_id=None
+):
+    """
+    Queue a message for delivery and return immediately. Takes the same
+    arguments as send_to_telegram; the queue paces sends to stay under
+    Telegram's flood limits and keeps them across restarts.
+    """
+    if chat_id is None:
+        chat_id = CHAT_ID
+    get_send_queue().enqueue(
+        chat_id,
+        message_text=message_text,
+        media_paths=media_paths,
+        media_types=media_types,
+        media_url=media_url,
+    )
+
+
+def _expected_length(response, offset):
+    """Total size of the file being downloaded, or None if the server doesn't say"""
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        # iter_content() yields decoded bytes, which won't match the header
+        return None
+    if response.status_code == 206:
+        content_range = response.headers.get("Content-Range", "")
+        total = content_range.rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length and length.isdigit() else None
+
+
+def download_media(url, path, retries=3, timeout=10, headers=None, progress=None):
     """
     Download media from URL to specified path
 
+    The body is written to "<path>.part" and only renamed into place once
+    its length matches what the server announced. A retry (or a later call
+    for the same path) resumes the partial file with a Range request when
+    the server supports it.
+
     Args:
         url: URL to download from
         path: Path to save the file
         retries: Number of retry attempts
         timeout: Connection timeout in seconds
+        headers: Extra request headers
+        progress: Optional callback(downloaded_bytes, total_bytes or None)
 
     Returns:
         bool: True if download was successful
     """
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    part_path = path + ".part"
 
     for attempt in range(retries):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request_headers = dict(headers or {})
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            response = requests.get(url, headers=headers, stream=True, timeout=timeout)
-            if response.status_code == 200:
-                try:
-                    with open(path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    print(f"Downloaded media to {path}")
-                    return True
-                except Exception as e:
-                    print(f"Error writing to {path}: {e}")
-                    return False
+            # Pooled session: repeated downloads from the same CDN reuse connections
+            with http_client.get(
+                url, headers=request_headers, stream=True, timeout=timeout
+            ) as response:
+                if response.status_code == 416 and offset:
+                    # Stale or oversized partial file, start over
+                    os.remove(part_path)
+                    print(f"Attempt {attempt+1}: discarding partial file {part_path}")
+                    continue
+                if response.status_code == 206 and offset:
+                    start = response.headers.get("Content-Range", "")[6:].split("-")[0]
+                    if start != str(offset):
+                        os.remove(part_path)
+                        print(f"Attempt {attempt+1}: unexpected Content-Range")
+                        continue
+                    mode = "ab"
+                    print(f"Resuming {url} at byte {offset}")
+                elif response.status_code == 200:
+                    # Server ignored the Range header (or none was sent)
+                    mode = "wb"
+                    offset = 0
+                else:
+                    print(f"Attempt {attempt+1}: HTTP {response.status_code}")
+                    time.sleep(2)
+                    continue
+
+                expected = _expected_length(response, offset)
+                downloaded = offset
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+                        if progress:
+                            progress(downloaded, expected)
+
+            if expected is not None and downloaded != expected:
+                print(
+                    f"Attempt {attempt+1}: incomplete download of {url} "
+                    f"({downloaded}/{expected} bytes)"
+                )
             else:
-                print(f"Attempt {attempt+1}: HTTP {response.status_code}")
+                os.replace(part_path, path)
+                print(f"Downloaded media to {path}")
+                return True
         except Exception as e:
             print(f"Attempt {attempt+1}: Error downloading media {url}: {e}")
         time.sleep(2)
@@ -0,0 +1,161 @@
+import os
+import ssl
+import hmac
+import queue
+import signal
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import telebot
+
+# Public HTTPS URL Telegram posts updates to; TLS can be terminated by a
+# reverse proxy in front of this server or by WEBHOOK_SSL_CERT/KEY
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_SSL_CERT = os.getenv("WEBHOOK_SSL_CERT", "")
+WEBHOOK_SSL_KEY = os.getenv("WEBHOOK_SSL_KEY", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+DRAIN_TIMEOUT = 60
+
+
+class WebhookServer:
+    """
+    Minimal HTTP endpoint for Telegram webhook updates.
+
+    The request thread only checks the secret token and queues the body, then
+    answers 200, so Telegram never waits on a slow handler. A fixed pool of
+    worker threads takes updates off the bounded queue and runs the bot's
+    handlers. When the queue is full the server answers 503 and Telegram
+    delivers the update again later. stop() stops accepting updates and lets
+    the workers finish what is already queued.
+    """
+
+    def __init__(
+        self,
+        bot,
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET,
+        workers=WEBHOOK_WORKERS,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+    ):
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.updates = queue.Queue(maxsize=queue_size)
+        self.workers = [
+            threading.Thread(target=self._work, name=f"webhook-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self.httpd = HTTPServer((listen, port), self._handler_class())
+        if WEBHOOK_SSL_CERT and WEBHOOK_SSL_KEY:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self._serve_thread = None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if not server.secret or not hmac.compare_digest(token, server.secret):
+                    self._reply(403)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                try:
+                    server.updates.put_nowait(body)
+                except queue.Full:
+                    self._reply(503)
+                    return
+                self._reply(200)
+
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # one line per update would drown the bot's own output
+
+        return Handler
+
+    def _work(self):
+        while True:
+            body = self.updates.get()
+            try:
+                if body is None:
+                    return
+                update = telebot.types.Update.de_json(body.decode("utf-8"))
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                print(f"Error handling webhook update: {e}")
+                traceback.print_exc()
+            finally:
+                self.updates.task_done()
+
+    def start(self):
+        # Handlers run on our workers instead of telebot's own thread pool
+        self.bot.threaded = False
+        for worker in self.workers:
+            worker.start()
+        self._serve_thread = threading.Thread(
+            target=self.httpd.serve_forever, name="webhook-http", daemon=True
+        )
+        self._serve_thread.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"Webhook server listening on {host}:{port}{self.path}")
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """Stop accepting updates and wait for queued ones to be handled"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        pending = self.updates.qsize()
+        if pending:
+            print(f"Draining {pending} queued updates...")
+        for _ in self.workers:
+            # Sentinels queue up behind the pending updates; block if full
+            self.updates.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        print("Webhook server stopped")
+
+
+def run(bot):
+    """Register the webhook with Telegram and serve until SIGINT/SIGTERM"""
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set to run in webhook mode")
+    if not WEBHOOK_SECRET:
+        # Without it anyone who finds the URL can post fake updates
+        raise ValueError("WEBHOOK_SECRET must be set to run in webhook mode")
+
+    server = WebhookServer(bot)
+    server.start()
+    bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_WORKERS * 2,
+    )
+
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    while not stopping.wait(1):
+        pass
+    # The webhook stays registered: Telegram keeps updates until we're back
+    server.stop()
@@ -7,12 +7,13 @@ import subprocess
 from yt_dlp import YoutubeDL
 
 import utils
+import transcode
 
 MEDIA_DIR = utils.MEDIA_DIR
 YOUTUBE_MEDIA_DIR = os.path.join(MEDIA_DIR, "youtube")
 
 
-async def process_video(video_url: str):
+async def process_video(video_url: str, progress=None):
     if not os.path.exists(YOUTUBE_MEDIA_DIR):
         os.makedirs(YOUTUBE_MEDIA_DIR)
     random_id = "".join(random.choices(string.ascii_letters + string.digits, k=8))
@@ -23,10 +24,21 @@ async def process_video(video_url: str):
         "merge_output_format": "mp4",
         "quiet": True,
     }
+    if progress:
+
+        def hook(status):
+            if status.get("status") == "downloading":
+                progress(f"downloading {status.get('_percent_str', '').strip()}")
+
+        ydl_opts["progress_hooks"] = [hook]
     try:
         with YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(video_url, download=True)
             filename = ydl.prepare_filename(info)
+        # bestvideo+bestaudio is often far beyond the Bot API upload limit
+        if progress:
+            progress("preparing video for upload", force=True)
+        filename = transcode.fit_for_upload(filename)
         return {"path": filename, "title": info.get("title", "Untitled")}
     except Exception as e:
         print(f"Error downloading YouTube video: {e}", file=sys.stderr)